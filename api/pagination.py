@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from webapp.pagination import decode_position, encode_position, newer_than, older_than
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Paginate posts newest first by seeking past the (time, id) of the page edge,
+    so every page costs one indexed range scan however deep the client goes
+    '''
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        # Use the requested size, capped by the server maximum
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.API_PAGE_SIZE
+        return min(max(page_size, 1), settings.API_MAX_PAGE_SIZE)
+
+    def encode_cursor(self, post, reverse):
+        # The cursor is opaque to clients: the page edge and the direction, base64 encoded
+        return replace_query_param(self.base_url, self.cursor_query_param, encode_position(post, reverse))
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            return decode_position(token)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        '''paginate_queryset for async views, reading the page with the async ORM'''
+        return self.paginate_rows([post async for post in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        # The query for the page the cursor points to, without running it
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        self.cursor = self.decode_cursor(request)
+        self.page_size = self.get_page_size(request)
+
+        # Posts without a time can't be placed on the keyset; every ingested or API created post has one
+        queryset = queryset.exclude(time__isnull=True)
+
+        if self.cursor is None:
+            self.reverse = False
+            queryset = queryset.order_by('-time', '-id')
+        else:
+            time, post_id, self.reverse = self.cursor
+            if self.reverse:
+                # Previous page: walk back up towards newer posts, then restore the newest first order
+                queryset = newer_than(queryset, time, post_id)
+            else:
+                queryset = older_than(queryset, time, post_id)
+
+        # Fetch one extra post to know whether there is another page in this direction
+        return queryset[:self.page_size + 1]
+
+    def paginate_rows(self, posts):
+        # Trim the page fetched by page_queryset and link the pages around it
+        has_more = len(posts) > self.page_size
+        posts = posts[:self.page_size]
+        if self.reverse:
+            posts.reverse()
+
+        # A cursor was followed to get here, so there is always a page back the way we came
+        has_next = has_more if not self.reverse else self.cursor is not None
+        has_previous = has_more if self.reverse else self.cursor is not None
+        self.next_link = self.encode_cursor(posts[-1], reverse=False) if posts and has_next else None
+        self.previous_link = self.encode_cursor(posts[0], reverse=True) if posts and has_previous else None
+        return posts
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
@@ -0,0 +1,31 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError: # Installed from requirements.txt; without it the stock encoder is used, with the same output
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''JSONRenderer encoding with orjson when it is installed, for large read responses'''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Fall back to the stock encoder for indented output and for types orjson doesn't know (e.g. lazy strings)
+        if orjson is None or data is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escape the line terminators that are valid JSON but not valid JavaScript, like JSONRenderer
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class PrometheusRenderer(BaseRenderer):
+    '''Render a pre-formatted Prometheus text exposition as is'''
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data.encode(self.charset) if isinstance(data, str) else data
@@ -1,24 +1,63 @@
 import random
-import time
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
 
-from webapp.models import HackerNewsPost, TYPES
+from webapp.cache import bump_generation
+from webapp.models import Author, HackerNewsPost, HourlyTypeCount, StoryCommentCount, TYPES
+from webapp.ranking import hot_score
+from webapp.rollups import post_values, record_changes
+
+
+def unique_post_ids(count):
+    '''Random post ids for API created posts, not used by any stored post'''
+    post_ids = set()
+    while len(post_ids) < count:
+        candidates = {random.randint(10_000_000, 99_999_999) for _ in range(count - len(post_ids))}
+        taken = set(HackerNewsPost.objects.filter(post_id__in=candidates).values_list('post_id', flat=True))
+        post_ids |= candidates - taken
+    return list(post_ids)
+
+
+class PostListSerializer(serializers.ListSerializer):
+    '''Create a batch of posts with a single INSERT, in one transaction'''
+
+    def create(self, validated_data):
+        post_ids = unique_post_ids(len(validated_data))
+        posts = [
+            HackerNewsPost(**self.child.new_post_values(item, post_id))
+            for item, post_id in zip(validated_data, post_ids)
+        ]
+        with transaction.atomic():
+            posts = HackerNewsPost.objects.bulk_create(posts)
+            record_changes(new_rows=[post_values(post) for post in posts])
+        bump_generation()
+        return posts
 
 
 class PostSerializer(serializers.ModelSerializer):
-    post_id = serializers.CharField(read_only=True)
+    post_id = serializers.IntegerField(read_only=True)
     by = serializers.CharField(read_only=True)
-    time = serializers.CharField(read_only=True)
+    time = serializers.DateTimeField(read_only=True)
     title = serializers.CharField(required=True)
     text = serializers.CharField(required=True)
     type = serializers.CharField()
     url = serializers.CharField()
     source = serializers.CharField(read_only=True)
+    score = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = HackerNewsPost
-        fields = ['id', 'post_id', 'by', 'time', 'title', 'text', 'type', 'url', 'source']
+        fields = ['id', 'post_id', 'by', 'time', 'title', 'text', 'type', 'url', 'source', 'score']
+        list_serializer_class = PostListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # Only output the requested subset of the fields, if any
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     def validate(self, attrs):
         # Custom validation for the serializer fields
@@ -34,23 +73,85 @@ class PostSerializer(serializers.ModelSerializer):
                 raise ValidationError(f'type can only be one of these choices: {TYPES}')
         return super().validate(attrs)
     
+    def new_post_values(self, validated_data, post_id):
+        # Values of a post created through the API; post_id is required before the first save
+        user = self.context.get('request').user
+        now = timezone.now()
+        return {
+            **validated_data,
+            'post_id': post_id,
+            'time': now,
+            'source': 'QuickCheck API',
+            'by': user.username,
+            'user_id': user.id,
+            'hot_score': hot_score(None, now), # Ranked like a fresh submission without votes
+        }
+
     def create(self, validated_data):
-        # Create a new HackerNewsPost instance
-        request = self.context.get('request')
-        user = request.user
-
-        # Create the post with validated data
-        post = super().create(validated_data)
-
-        # Generate unique values for post_id and time
-        post.post_id = random.randint(10_000_000, 99_999_999)
-        post.time = int(time.time())
-
-        # Set additional fields
-        post.source = 'QuickCheck API'
-        post.by = user.username
-        post.user_id = user.id
-        
-        # Save and return the post
-        post.save()
-        return post
\ No newline at end of file
+        # Create the post with validated data, count it in the rollups and invalidate the cached responses
+        with transaction.atomic():
+            post = super().create(self.new_post_values(validated_data, unique_post_ids(1)[0]))
+            record_changes(new_rows=[post_values(post)])
+        bump_generation()
+        return post
+
+    def update(self, instance, validated_data):
+        # Update the post, move the rollups if its type changed and invalidate the cached responses
+        old_row = post_values(instance)
+        with transaction.atomic():
+            post = super().update(instance, validated_data)
+            record_changes([old_row], [post_values(post)])
+        bump_generation()
+        return post
+
+
+class HourlyTypeCountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HourlyTypeCount
+        fields = ['hour', 'type', 'posts']
+
+
+class StoryCommentCountSerializer(serializers.ModelSerializer):
+    title = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StoryCommentCount
+        fields = ['story_id', 'title', 'comments']
+
+    def get_title(self, obj):
+        # Titles are looked up for the whole list at once by the view
+        return self.context.get('titles', {}).get(obj.story_id)
+
+
+class AuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Author
+        fields = ['name', 'submissions', 'comments', 'score']
+
+
+def parse_fields(values):
+    '''Fields requested with the `fields` query parameter, in output order; None when every field is wanted'''
+    requested = {name.strip() for value in values for name in value.split(',') if name.strip()}
+    if not requested:
+        return None
+    unknown = requested - set(PostSerializer.Meta.fields)
+    if unknown:
+        raise ValidationError({'fields': f'Unknown fields {sorted(unknown)}, choose from {PostSerializer.Meta.fields}'})
+    return [name for name in PostSerializer.Meta.fields if name in requested]
+
+
+def serialize_rows(rows, fields=None):
+    '''
+    Fast read path of PostSerializer: the same output built straight from .values()
+    rows, without a field object graph per post
+    '''
+    fields = fields or PostSerializer.Meta.fields
+    data = []
+    for row in rows:
+        post = {name: row[name] for name in fields}
+        if post.get('time') is not None:
+            # Match DateTimeField: ISO 8601 in the current timezone, UTC written as Z
+            value = timezone.localtime(post['time']).isoformat()
+            post['time'] = value[:-6] + 'Z' if value.endswith('+00:00') else value
+        data.append(post)
+    return data
@@ -1,9 +1,24 @@
+import gzip
 import json
+from datetime import datetime, timedelta, timezone
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 
-from webapp.models import HackerNewsPost
+from api.renderers import FastJSONRenderer
+from api.serializers import PostSerializer, serialize_rows
+from webapp.cache import bump_generation, cache_stats
+from webapp.metrics import JobMetrics
+from webapp.models import Author, HackerNewsPost, HourlyTypeCount, StoryCommentCount
+from webapp.rollups import hour_of
 
 
 class SignUpTestCase(APITestCase):
@@ -11,6 +26,7 @@ class SignUpTestCase(APITestCase):
     Test for user registration
     '''
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user_data = {
             "email": "testuser@test.com",
@@ -172,4 +188,435 @@ class SignUpTestCase(APITestCase):
         token = self.signup_and_login_user() # register a test user and get their token
         self.client.post(self.add_post_url, self.post_data, HTTP_AUTHORIZATION=f'Bearer {token}') # create a post with the test user
         response = self.client.delete(self.manage_post_url.format(post_id='90000000'), HTTP_AUTHORIZATION=f'Bearer {token}')
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PaginationTestCase(APITestCase):
+    '''
+    Tests for the keyset pagination of all posts
+    '''
+    def setUp(self):
+        cache.clear()
+        self.get_all_posts_url = '/api/all-posts/'
+        start = datetime(2023, 6, 1, tzinfo=timezone.utc)
+        # Seven posts, two of them sharing a time so the id breaks the tie
+        times = [start + timedelta(minutes=minutes) for minutes in [0, 1, 2, 2, 3, 4, 5]]
+        HackerNewsPost.objects.bulk_create(
+            HackerNewsPost(post_id=index + 1, time=time, title=f'Post {index}', text='text', type='job' if index % 2 else 'story')
+            for index, time in enumerate(times)
+        )
+        self.newest_first = list(HackerNewsPost.objects.order_by('-time', '-id').values_list('post_id', flat=True))
+
+    def test_walk_every_page_forward_and_back(self):
+        pages = []
+        url = f'{self.get_all_posts_url}?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            url = response.data['next']
+
+        self.assertEqual([post['post_id'] for page in pages for post in page['results']], self.newest_first)
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]['previous'])
+
+        # The previous cursor of the last page leads back to the middle page
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+    def test_page_size_is_capped(self):
+        with override_settings(API_MAX_PAGE_SIZE=2):
+            response = self.client.get(f'{self.get_all_posts_url}?page_size=1000')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_filters_apply_to_every_page(self):
+        response = self.client.get(f'{self.get_all_posts_url}?type=job&page_size=2')
+        results = response.data['results'] + self.client.get(response.data['next']).data['results']
+        self.assertEqual({post['type'] for post in results}, {'job'})
+        self.assertEqual(len(results), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'{self.get_all_posts_url}?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ResponseCacheTestCase(APITestCase):
+    '''
+    Tests for the response cache and its invalidation
+    '''
+    def setUp(self):
+        cache.clear()
+        self.post = HackerNewsPost.objects.create(post_id=1, type='story', title='Cached', time=datetime(2023, 6, 1, tzinfo=timezone.utc))
+        self.user = get_user_model().objects.create_user(username='testuser', email='testuser@test.com', password='password')
+        HackerNewsPost.objects.filter(post_id=1).update(user_id=self.user.id)
+
+    def test_equivalent_requests_share_an_entry(self):
+        self.client.get('/api/all-posts/?type=story&type=job&search=')
+        with self.assertNumQueries(1): # Only the data generation is read
+            response = self.client.get('/api/all-posts/?type=job&type=story')
+        self.assertEqual(response.data['results'][0]['title'], 'Cached')
+        self.assertEqual(cache_stats()['all_posts'], {'hits': 1, 'misses': 1})
+
+    def test_api_writes_invalidate_the_cache(self):
+        self.assertEqual(self.client.get('/api/post/1/').data['title'], 'Cached')
+        self.client.force_authenticate(self.user)
+        self.client.put('/api/manage-post/1/', {'title': 'Updated'})
+        self.assertEqual(self.client.get('/api/post/1/').data['title'], 'Updated')
+
+        self.client.delete('/api/manage-post/1/')
+        self.assertEqual(self.client.get('/api/post/1/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_pages_are_cached(self):
+        self.client.get('/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/')
+        self.assertContains(response, 'Cached')
+        HackerNewsPost.objects.filter(post_id=1).update(title='Renamed')
+        bump_generation()
+        self.assertContains(self.client.get('/'), 'Renamed')
+
+
+class ConditionalGetTestCase(APITestCase):
+    '''
+    Tests for ETag and Last-Modified revalidation of the posts API
+    '''
+    def setUp(self):
+        cache.clear()
+        HackerNewsPost.objects.create(post_id=1, type='story', title='Story', time=datetime(2023, 6, 1, tzinfo=timezone.utc))
+        HackerNewsPost.objects.create(post_id=2, type='job', title='Job', time=datetime(2023, 6, 2, tzinfo=timezone.utc))
+        bump_generation()
+
+    def test_unchanged_data_is_not_sent_again(self):
+        response = self.client.get('/api/all-posts/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1): # Only the data generation is read
+            response = self.client.get('/api/all-posts/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_depends_on_the_parameters_and_the_data(self):
+        etag = self.client.get('/api/post/1/')['ETag']
+        self.assertNotEqual(self.client.get('/api/post/2/')['ETag'], etag)
+
+        bump_generation()
+        response = self.client.get('/api/post/1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/api/post/1/')['Last-Modified']
+        response = self.client.get('/api/post/1/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class FastReadPathTestCase(APITestCase):
+    '''
+    Tests that the fast read path matches PostSerializer
+    '''
+    def setUp(self):
+        HackerNewsPost.objects.create(post_id=1, type='story', title='Story \u2028', by='alice', time=datetime(2023, 6, 1, 12, 30, 5, 250, tzinfo=timezone.utc))
+        HackerNewsPost.objects.create(post_id=2, type='job', title=None, url='https://example.com')
+
+    def test_rows_serialize_like_the_model_serializer(self):
+        posts = HackerNewsPost.objects.order_by('id')
+        self.assertEqual(serialize_rows(posts.values(*PostSerializer.Meta.fields)), PostSerializer(posts, many=True).data)
+
+    def test_fast_renderer_output_matches_json_renderer(self):
+        data = serialize_rows(HackerNewsPost.objects.order_by('id').values(*PostSerializer.Meta.fields))
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class SparseFieldsetTestCase(APITestCase):
+    '''
+    Tests for the fields query parameter
+    '''
+    def setUp(self):
+        cache.clear()
+        HackerNewsPost.objects.create(post_id=1, type='story', title='Story', text='Long text', score=42, time=datetime(2023, 6, 1, tzinfo=timezone.utc))
+
+    def test_list_selects_and_returns_only_the_requested_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/all-posts/?fields=title,score&fields=time')
+        self.assertEqual(response.data['results'], [{'time': '2023-06-01T00:00:00Z', 'title': 'Story', 'score': 42}])
+        post_query = next(query['sql'] for query in queries if 'webapp_hackernewspost' in query['sql'])
+        self.assertNotIn('"text"', post_query)
+
+    def test_detail_returns_only_the_requested_fields(self):
+        response = self.client.get('/api/post/1/?fields=id,title')
+        self.assertEqual(set(response.data), {'id', 'title'})
+        self.assertEqual(set(self.client.get('/api/post/1/').data), set(PostSerializer.Meta.fields))
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/all-posts/?fields=title,password')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchTestCase(APITestCase):
+    '''
+    Tests for the batch create and batch read endpoints
+    '''
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='testuser', email='testuser@test.com', password='password')
+        self.client.force_authenticate(self.user)
+        self.posts = [
+            {'title': f'Title {index}', 'text': 'Text', 'type': 'story', 'url': 'https://testurl.com/'}
+            for index in range(3)
+        ]
+
+    def test_batch_create_inserts_every_post_at_once(self):
+        bump_generation()
+        with self.assertNumQueries(9): # Id check, savepoint, one insert, an insert and an increment per rollup, release, generation bump
+            response = self.client.post('/api/add-posts/', self.posts, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created'] * 3)
+        self.assertEqual(HackerNewsPost.objects.filter(user_id=self.user.id, source='QuickCheck API').count(), 3)
+        self.assertEqual(len({result['post']['post_id'] for result in response.data['results']}), 3)
+
+    def test_batch_create_is_all_or_nothing(self):
+        self.posts[1]['type'] = 'comment'
+        response = self.client.post('/api/add-posts/', self.posts, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([result['status'] for result in response.data['results']], ['not_created', 'invalid', 'not_created'])
+        self.assertFalse(HackerNewsPost.objects.exists())
+
+        with override_settings(API_MAX_BATCH_SIZE=2):
+            response = self.client.post('/api/add-posts/', self.posts, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_read_resolves_ids_with_one_query(self):
+        HackerNewsPost.objects.create(post_id=1, type='story', title='One')
+        HackerNewsPost.objects.create(post_id=2, type='story', title='Two')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/posts/?ids=2,404&ids=1&fields=title')
+        self.assertEqual(response.data['results'], [
+            {'post_id': 2, 'status': 'found', 'post': {'title': 'Two'}},
+            {'post_id': 404, 'status': 'not_found'},
+            {'post_id': 1, 'status': 'found', 'post': {'title': 'One'}},
+        ])
+        self.assertEqual(self.client.get('/api/posts/?ids=1,x').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TopPostsTestCase(APITestCase):
+    '''
+    Tests for the hottest posts endpoint
+    '''
+    def setUp(self):
+        cache.clear()
+        for post_id, hot in [(1, 0.5), (2, 3.0), (3, None), (4, 1.5)]:
+            HackerNewsPost.objects.create(post_id=post_id, type='story', title=f'Post {post_id}', hot_score=hot)
+
+    def test_top_posts_by_hot_score(self):
+        response = self.client.get('/api/top/?limit=2&fields=post_id,title')
+        self.assertEqual(response.data['results'], [{'post_id': 2, 'title': 'Post 2'}, {'post_id': 4, 'title': 'Post 4'}])
+        response = self.client.get('/api/top/')
+        self.assertEqual([post['post_id'] for post in response.data['results']], [2, 4, 1])
+
+
+class ExportTestCase(APITestCase):
+    '''
+    Tests for the streaming NDJSON export
+    '''
+    def setUp(self):
+        self.export_url = '/api/export/'
+        HackerNewsPost.objects.create(post_id=1, type='story', title='Story', source='Hacker API', time=datetime(2023, 6, 1, tzinfo=timezone.utc))
+        HackerNewsPost.objects.create(post_id=2, type='comment', text='Comment', parent_id=1, source='Hacker API')
+        HackerNewsPost.objects.create(post_id=3, type='job', title='Job', source='QuickCheck API')
+
+    def read_rows(self, response):
+        body = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return [json.loads(line) for line in body.decode().splitlines()]
+
+    def test_export_streams_every_row(self):
+        response = self.client.get(self.export_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = self.read_rows(response)
+        self.assertEqual([row['post_id'] for row in rows], [1, 2, 3])
+        self.assertEqual(rows[1]['parent_id'], 1)
+        self.assertEqual(rows[0]['time'], '2023-06-01T00:00:00Z')
+
+    def test_export_filters(self):
+        response = self.client.get(self.export_url, {'type': ['story', 'comment'], 'source': 'Hacker API'})
+        self.assertEqual([row['post_id'] for row in self.read_rows(response)], [1, 2])
+
+        response = self.client.get(self.export_url, {'since': '2999-01-01'})
+        self.assertEqual(self.read_rows(response), [])
+
+        response = self.client.get(self.export_url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_gzip(self):
+        response = self.client.get(self.export_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(self.read_rows(response)), 3)
+
+        # A zero q-value refuses the coding, whether gzip is named or only matched by *
+        for accept_encoding in ['gzip;q=0, deflate', 'GZIP; Q=0.0', 'br, *;q=0', 'identity']:
+            response = self.client.get(self.export_url, HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertFalse(response.has_header('Content-Encoding'), accept_encoding)
+        response = self.client.get(self.export_url, HTTP_ACCEPT_ENCODING='br;q=1.0, *;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class MetricsTestCase(APITestCase):
+    '''
+    Tests for the ingestion metrics endpoint
+    '''
+    def setUp(self):
+        self.metrics_url = '/api/metrics/'
+        JobMetrics('make_request').finish({'fetched': 4, 'skipped': 6, 'written': 3, 'paused': False})
+
+    def test_metrics_require_a_staff_user(self):
+        response = self.client.get(self.metrics_url)
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+        user = get_user_model().objects.create_user(username='testuser', email='testuser@test.com', password='password')
+        self.client.force_authenticate(user)
+        response = self.client.get(self.metrics_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_metrics_in_prometheus_format(self):
+        admin = get_user_model().objects.create_user(username='admin', email='admin@test.com', password='password', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get(self.metrics_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('quickcheck_ingestion_items_written_total{job="make_request"} 3', body)
+        self.assertIn('quickcheck_ingestion_runs_total{job="make_request"} 1', body)
+        self.assertIn('quickcheck_ingestion_last_run_failed{job="make_request"} 0', body)
+        self.assertIn('quickcheck_ingestion_last_run_unchanged_ratio{job="make_request"} 0.25', body)
+        self.assertIn('# TYPE quickcheck_ingestion_fetch_latency_seconds histogram', body)
+        self.assertIn('quickcheck_response_cache_hits_total{view="all_posts"}', body)
+
+
+class StatsTestCase(APITestCase):
+    '''
+    Tests for the statistics rollups kept by the API writes and the stats endpoint
+    '''
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='testuser', email='testuser@test.com', password='password')
+        self.client.force_authenticate(self.user)
+
+    def test_writes_move_the_rollups(self):
+        posts = [{'title': 'Title', 'text': 'Text', 'type': 'story', 'url': 'https://testurl.com/'}] * 2
+        self.client.post('/api/add-posts/', posts, format='json')
+        response = self.client.post('/api/add-post/', {**posts[0], 'type': 'job'}, format='json')
+        self.assertEqual(Author.objects.get(name='testuser').submissions, 3)
+        counts = dict(HourlyTypeCount.objects.values_list('type', 'posts'))
+        self.assertEqual(counts, {'story': 2, 'job': 1})
+
+        # Changing the type moves the post between hourly counts, deleting it uncounts it
+        post_id = response.data['post_id']
+        self.client.put(f'/api/manage-post/{post_id}/', {'type': 'poll'}, format='json')
+        self.assertEqual(dict(HourlyTypeCount.objects.values_list('type', 'posts')), {'story': 2, 'job': 0, 'poll': 1})
+        self.client.delete(f'/api/manage-post/{post_id}/')
+        self.assertEqual(HourlyTypeCount.objects.get(type='poll').posts, 0)
+        self.assertEqual(Author.objects.get(name='testuser').submissions, 2)
+
+    def test_stats_are_read_from_the_rollups(self):
+        now = datetime.now(timezone.utc)
+        HourlyTypeCount.objects.create(type='story', hour=hour_of(now), posts=4)
+        HourlyTypeCount.objects.create(type='story', hour=hour_of(now) - timedelta(hours=30), posts=9)
+        HackerNewsPost.objects.create(post_id=1, type='story', title='Busy')
+        StoryCommentCount.objects.create(story_id=1, comments=12)
+        StoryCommentCount.objects.create(story_id=2, comments=3)
+        Author.objects.create(name='alice', submissions=2, score=50)
+        Author.objects.create(name='bob', submissions=1, score=80)
+
+        with self.assertNumQueries(5): # Generation, hourly counts, stories, their titles, authors
+            response = self.client.get('/api/stats/?limit=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['type'], row['posts']) for row in response.data['posts_per_hour']], [('story', 4)])
+        self.assertEqual(response.data['top_stories'], [{'story_id': 1, 'title': 'Busy', 'comments': 12}])
+        self.assertEqual(response.data['top_authors'], [{'name': 'bob', 'submissions': 1, 'comments': 0, 'score': 80}])
+
+        response = self.client.get('/api/stats/?hours=48')
+        self.assertEqual([row['posts'] for row in response.data['posts_per_hour']], [9, 4])
+        self.assertEqual(self.client.get('/api/stats/?hours=x').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UserPostsTestCase(APITestCase):
+    '''
+    Tests for the per-author feed
+    '''
+    def setUp(self):
+        cache.clear()
+        now = datetime.now(timezone.utc)
+        for post_id in range(1, 6):
+            HackerNewsPost.objects.create(
+                post_id=post_id, by='alice', type='comment' if post_id % 2 else 'story',
+                parent_id=100 if post_id % 2 else None, time=now - timedelta(hours=post_id),
+            )
+        HackerNewsPost.objects.create(post_id=6, by='bob', type='story', time=now)
+        Author.objects.create(name='alice', submissions=2, comments=3, score=40)
+
+    def test_feed_pages_through_the_authors_posts(self):
+        response = self.client.get('/api/users/alice/?page_size=3&fields=post_id,type')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['author'], {'name': 'alice', 'submissions': 2, 'comments': 3, 'score': 40})
+        self.assertEqual(response.data['results'], [{'post_id': 1, 'type': 'comment'}, {'post_id': 2, 'type': 'story'}, {'post_id': 3, 'type': 'comment'}])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([post['post_id'] for post in response.data['results']], [4, 5])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get('/api/users/alice/?type=story')
+        self.assertEqual([post['post_id'] for post in response.data['results']], [2, 4])
+
+    def test_unknown_author(self):
+        self.assertEqual(self.client.get('/api/users/nobody/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncViewsTestCase(APITestCase):
+    '''
+    Tests for the async variants of the read endpoints
+    '''
+    def setUp(self):
+        cache.clear()
+        start = datetime(2023, 6, 1, tzinfo=timezone.utc)
+        for post_id in range(1, 6):
+            HackerNewsPost.objects.create(post_id=post_id, type='story', title=f'Post {post_id}', time=start + timedelta(hours=post_id))
+
+    def async_get(self, path, **headers):
+        # The async test client takes header names rather than HTTP_* keywords
+        headers = {name[5:].replace('_', '-'): value for name, value in headers.items()}
+
+        async def get():
+            return await self.async_client.get(path, **headers)
+        return async_to_sync(get)()
+
+    def test_all_posts_pages_match_the_sync_view(self):
+        sync = self.client.get('/api/all-posts/?page_size=2&fields=post_id,title', HTTP_ACCEPT='application/json').json()
+        cache.clear()
+        response = self.async_get('/api/async/all-posts/?page_size=2&fields=post_id,title', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = response.json()
+        self.assertEqual(page['results'], sync['results'])
+        self.assertEqual([post['post_id'] for post in page['results']], [5, 4])
+
+        # The cursors link to the async endpoint
+        page = self.async_get(page['next']).json()
+        self.assertEqual([post['post_id'] for post in page['results']], [3, 2])
+        self.assertIn('/api/async/all-posts/', page['previous'])
+
+    def test_one_post_and_errors(self):
+        response = self.async_get('/api/async/post/3/?fields=post_id,title')
+        self.assertEqual(response.json(), {'post_id': 3, 'title': 'Post 3'})
+        response = self.async_get('/api/async/post/404/')
+        self.assertEqual((response.status_code, response.json()), (status.HTTP_404_NOT_FOUND, {'detail': 'Not found.'}))
+        self.assertEqual(self.async_get('/api/async/post/3/?fields=nope').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_conditional_get_shares_the_sync_validators(self):
+        bump_generation()
+        etag = self.client.get('/api/post/3/', HTTP_ACCEPT='application/json')['ETag']
+        response = self.async_get('/api/async/post/3/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response['ETag'], etag)
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.async_get('/api/async/post/3/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
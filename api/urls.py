@@ -5,7 +5,16 @@ from api import views
 app_name = 'api'
 urlpatterns = [
     path('all-posts/', views.GetAllPosts.as_view(), name='all_posts'), # Endpoint to retrieve all posts
-    path('post/<post_id>/', views.OnePost.as_view(), name='one_post'), # Endpoint to retrieve a specific post by post_id
-    path('manage-post/<post_id>/', views.MangePost.as_view(), name='manage_post'), # Endpoint to manage (update/delete) a specific post by post_id
+    path('post/<int:post_id>/', views.OnePost.as_view(), name='one_post'), # Endpoint to retrieve a specific post by post_id
+    path('manage-post/<int:post_id>/', views.MangePost.as_view(), name='manage_post'), # Endpoint to manage (update/delete) a specific post by post_id
     path('add-post/', views.AddPost.as_view(), name='add_post'), # Endpoint to add a new post
+    path('top/', views.TopPosts.as_view(), name='top_posts'), # Endpoint to retrieve the hottest posts
+    path('posts/', views.GetPosts.as_view(), name='posts'), # Endpoint to retrieve a batch of posts by post_id
+    path('add-posts/', views.AddPosts.as_view(), name='add_posts'), # Endpoint to add a batch of posts
+    path('export/', views.ExportPosts.as_view(), name='export'), # Endpoint streaming every post and comment as NDJSON
+    path('users/<str:name>/', views.UserPosts.as_view(), name='user_posts'), # Endpoint to retrieve an author's counters and their posts and comments
+    path('async/all-posts/', views.AsyncGetAllPosts.as_view(), name='async_all_posts'), # all-posts/ on the async ORM, for ASGI
+    path('async/post/<int:post_id>/', views.AsyncOnePost.as_view(), name='async_one_post'), # post/<post_id>/ on the async ORM, for ASGI
+    path('stats/', views.Stats.as_view(), name='stats'), # Endpoint serving the precomputed post, story and author statistics
+    path('metrics/', views.IngestionMetrics.as_view(), name='metrics'), # Endpoint exposing the ingestion job metrics to Prometheus
 ]
\ No newline at end of file
@@ -1,16 +1,62 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from rest_framework.permissions import IsAuthenticated
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.http import condition
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
-from webapp.models import HackerNewsPost
-from api.serializers import PostSerializer
+from webapp.cache import (
+    aget_or_compute, ageneration_state, async_conditional, bump_generation, conditional, generation_state, get_or_compute,
+)
+from webapp.exports import accepts_gzip, export_queryset, gzip_stream, iter_ndjson, parse_since
+from webapp.metrics import render_prometheus
+from webapp.models import Author, HackerNewsPost, HourlyTypeCount, StoryCommentCount
+from webapp.rollups import hour_of, post_values, record_changes
+from webapp.search import search_posts
+from api.pagination import KeysetPagination
+from api.renderers import FastJSONRenderer, PrometheusRenderer
+from api.serializers import (
+    AuthorSerializer, HourlyTypeCountSerializer, PostSerializer, StoryCommentCountSerializer, parse_fields, serialize_rows,
+)
 
 
 class GetAllPosts(APIView):
-    '''Retrieve all posts from the database'''
+    '''Retrieve the posts from the database, newest first, one page at a time'''
+    pagination_class = KeysetPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    @staticmethod
+    def cache_params(request, **kwargs):
+        # Links to other pages are absolute, and the format depends on the Accept header
+        return dict(request.query_params.lists(), host=[request.get_host()], accept=[request.META.get('HTTP_ACCEPT', '')])
+
+    # Answer with a 304 while the client's copy is still current, otherwise serve the page from the cache
+    @method_decorator(condition(**conditional('all_posts', cache_params)))
     def get(self, request):
+        generation, _ = generation_state(request)
+        data = get_or_compute('all_posts', self.cache_params(request), lambda: self.get_page(request), generation)
+        return Response(data, status.HTTP_200_OK)
+
+    def get_page(self, request):
+        # Fetch only the requested page, as plain rows, and serialize it on the fast path
+        posts, fields = self.get_rows(request)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(posts, request, view=self)
+
+        # Return the page with the cursors of the next and previous pages
+        return paginator.get_paginated_response(serialize_rows(page, fields)).data
+
+    def get_rows(self, request):
         # Get the 'type' and 'search' query parameters from the request
         post_types = request.query_params.getlist('type')
         search_text = request.query_params.get('search')
@@ -21,33 +67,168 @@ class GetAllPosts(APIView):
         else:
             posts = HackerNewsPost.objects.all()
 
-        # Exclude posts that have a value in the 'parent' field
-        # Necessary because we only want to return posts and not their comments
-        posts = posts.exclude(parent__isnull=False)
+        # Only keep posts without a value in the 'parent' field
+        # Necessary because we only want to return posts and not their comments; written as parent IS NULL so the
+        # (parent, time) and (parent, type, time) indexes serve the listing
+        posts = posts.filter(parent__isnull=True)
         
-        # Filter the posts by search text if the 'search' query parameter is provided
+        # Full-text search the title, text and author if the 'search' query parameter is provided
         if search_text:
-            posts = posts.filter(text__icontains=search_text)
+            posts = search_posts(posts, search_text)
+
+        # Only select the requested columns, plus the (time, id) the page cursors are built from
+        fields = parse_fields(request.query_params.getlist('fields')) or PostSerializer.Meta.fields
+        columns = list(dict.fromkeys(fields + ['time', 'id']))
+        return posts.values(*columns), fields
+
+
+class TopPosts(APIView):
+    '''Retrieve the hottest posts, ranked by their precomputed hot score'''
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    @staticmethod
+    def cache_params(request, **kwargs):
+        return dict(request.query_params.lists(), accept=[request.META.get('HTTP_ACCEPT', '')])
 
-        # Serialize the posts
-        serializer = PostSerializer(posts, many=True)
+    # Answer with a 304 while the ranking hasn't changed, otherwise serve the list from the cache
+    @method_decorator(condition(**conditional('top_posts', cache_params)))
+    def get(self, request):
+        generation, _ = generation_state(request)
+        data = get_or_compute('top_posts', self.cache_params(request), lambda: self.get_top(request), generation)
+        return Response(data, status.HTTP_200_OK)
+
+    def get_top(self, request):
+        # The first `limit` posts, capped like the page size of the other listings
+        try:
+            limit = min(max(int(request.query_params.get('limit', settings.API_PAGE_SIZE)), 1), settings.API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ValidationError({'limit': 'limit must be a number'})
 
-        # Return the serialized data in the response
-        return Response(serializer.data, status.HTTP_200_OK)
+        # Read the ranking straight off the (parent, hot_score) index, selecting only the requested fields
+        fields = parse_fields(request.query_params.getlist('fields')) or PostSerializer.Meta.fields
+        posts = (
+            HackerNewsPost.objects.filter(parent__isnull=True, hot_score__isnull=False)
+            .order_by('-hot_score', '-id').values(*fields)[:limit]
+        )
+        return {'results': serialize_rows(posts, fields)}
 
 
 class OnePost(APIView):
     '''# Retrieve a single post based on the post_id'''
-    def get(self, request, post_id):
-        post = get_object_or_404(HackerNewsPost, post_id=post_id)
+    @staticmethod
+    def cache_params(request, post_id):
+        return dict(request.query_params.lists(), post_id=[post_id], accept=[request.META.get('HTTP_ACCEPT', '')])
 
-        # Serialize the post
-        serializer = PostSerializer(post)
+    # Answer with a 304 while the client's copy is still current
+    @method_decorator(condition(**conditional('one_post', cache_params)))
+    def get(self, request, post_id):
+        # Serialize the post, or reuse the cached serialization until a write bumps the data generation
+        generation, _ = generation_state(request)
+        data = get_or_compute('one_post', self.cache_params(request, post_id), lambda: self.serialize(request, post_id), generation)
 
          # Return the serialized data in the response
-        return Response(serializer.data, status.HTTP_200_OK)
+        return Response(data, status.HTTP_200_OK)
+
+    def serialize(self, request, post_id):
+        posts, fields = self.get_posts(request)
+        post = get_object_or_404(posts, post_id=post_id)
+        return PostSerializer(post, fields=fields).data
+
+    def get_posts(self, request):
+        # Only load and output the fields asked for with the 'fields' query parameter
+        fields = parse_fields(request.query_params.getlist('fields'))
+        return (HackerNewsPost.objects.only(*fields) if fields else HackerNewsPost.objects.all()), fields
     
 
+class AsyncAPIView(View):
+    '''
+    Async counterpart of APIView for read endpoints served under ASGI, since DRF has no async views:
+    the request is wrapped like APIView does so the sync views' helpers can be shared, the data is
+    rendered as JSON and API exceptions become their usual error responses
+    '''
+    renderer_class = FastJSONRenderer
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(Request(request), *args, **kwargs)
+        except APIException as exc:
+            # Same body as DRF's exception handler
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return self.render(detail, exc.status_code)
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        renderer = self.renderer_class()
+        return HttpResponse(renderer.render(data), content_type=renderer.media_type, status=status_code)
+
+
+class AsyncGetAllPosts(AsyncAPIView):
+    '''GetAllPosts on the async ORM: the same pages, cache entries and validators, without tying up a thread'''
+    pagination_class = KeysetPagination
+
+    @async_conditional('all_posts', GetAllPosts.cache_params)
+    async def get(self, request):
+        generation, _ = await ageneration_state(request)
+        return self.render(await aget_or_compute('all_posts', GetAllPosts.cache_params(request), lambda: self.get_page(request), generation))
+
+    async def get_page(self, request):
+        posts, fields = GetAllPosts().get_rows(request)
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(posts, request, view=self)
+        return paginator.get_paginated_response(serialize_rows(page, fields)).data
+
+
+class AsyncOnePost(AsyncAPIView):
+    '''OnePost on the async ORM, sharing its cache entries and validators'''
+
+    @async_conditional('one_post', OnePost.cache_params)
+    async def get(self, request, post_id):
+        generation, _ = await ageneration_state(request)
+        return self.render(await aget_or_compute('one_post', OnePost.cache_params(request, post_id), lambda: self.serialize(request, post_id), generation))
+
+    async def serialize(self, request, post_id):
+        posts, fields = OnePost().get_posts(request)
+        try:
+            post = await posts.aget(post_id=post_id)
+        except HackerNewsPost.DoesNotExist:
+            raise NotFound()
+        return PostSerializer(post, fields=fields).data
+
+
+class UserPosts(APIView):
+    '''Retrieve an author's counters and their posts and comments, newest first, one page at a time'''
+    pagination_class = KeysetPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    @staticmethod
+    def cache_params(request, name):
+        # Links to other pages are absolute, and the format depends on the Accept header
+        return dict(request.query_params.lists(), name=[name], host=[request.get_host()], accept=[request.META.get('HTTP_ACCEPT', '')])
+
+    # Answer with a 304 while the client's copy is still current, otherwise serve the page from the cache
+    @method_decorator(condition(**conditional('user_posts', cache_params)))
+    def get(self, request, name):
+        generation, _ = generation_state(request)
+        data = get_or_compute('user_posts', self.cache_params(request, name), lambda: self.get_page(request, name), generation)
+        return Response(data, status.HTTP_200_OK)
+
+    def get_page(self, request, name):
+        # The counters come from the author's rollup row instead of counting their posts
+        author = get_object_or_404(Author, name=name)
+
+        # Posts and comments alike, optionally of some types only
+        posts = HackerNewsPost.objects.filter(by=name)
+        post_types = request.query_params.getlist('type')
+        if post_types:
+            posts = posts.filter(type__in=post_types)
+
+        # Seek through the (by, time) index, selecting only the requested columns plus the cursor's (time, id)
+        fields = parse_fields(request.query_params.getlist('fields')) or PostSerializer.Meta.fields
+        columns = list(dict.fromkeys(fields + ['time', 'id']))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(posts.values(*columns), request, view=self)
+        return {'author': AuthorSerializer(author).data, **paginator.get_paginated_response(serialize_rows(page, fields)).data}
+
+
 class AddPost(APIView):
     '''Add a post to the database'''
     permission_classes = [IsAuthenticated]
@@ -68,6 +249,59 @@ class AddPost(APIView):
         return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+class AddPosts(APIView):
+    '''Add a batch of posts to the database, all or none of them'''
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({'errors': ['Expected a list of posts']}, status.HTTP_400_BAD_REQUEST)
+
+        # Validate every post, then insert them all with one query in one transaction
+        serializer = PostSerializer(data=request.data, many=True, max_length=settings.API_MAX_BATCH_SIZE, context={'request': request})
+        if serializer.is_valid():
+            serializer.save()
+            results = [{'index': index, 'status': 'created', 'post': post} for index, post in enumerate(serializer.data)]
+            return Response({'results': results}, status.HTTP_201_CREATED)
+
+        # Errors about the batch itself, such as its size, aren't per item
+        if not isinstance(serializer.errors, list):
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        # Report each post's errors; the valid ones weren't created either
+        results = [
+            {'index': index, 'status': 'invalid', 'errors': errors} if errors else {'index': index, 'status': 'not_created'}
+            for index, errors in enumerate(serializer.errors)
+        ]
+        return Response({'results': results}, status.HTTP_400_BAD_REQUEST)
+
+
+class GetPosts(APIView):
+    '''Retrieve a batch of posts by post_id'''
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        # Ids are comma separated and/or repeated: ?ids=1,2&ids=3
+        try:
+            post_ids = list(dict.fromkeys(int(value) for values in request.query_params.getlist('ids') for value in values.split(',') if value))
+        except ValueError:
+            raise ValidationError({'ids': 'ids must be post ids separated by commas'})
+        if len(post_ids) > settings.API_MAX_BATCH_SIZE:
+            raise ValidationError({'ids': f'At most {settings.API_MAX_BATCH_SIZE} ids can be fetched at once'})
+
+        # Resolve every id with a single IN query, selecting only the requested fields
+        fields = parse_fields(request.query_params.getlist('fields')) or PostSerializer.Meta.fields
+        rows = list(HackerNewsPost.objects.filter(post_id__in=post_ids).values(*dict.fromkeys(fields + ['post_id'])))
+        posts = {row['post_id']: post for row, post in zip(rows, serialize_rows(rows, fields))}
+
+        # One result per requested id, in the requested order
+        results = [
+            {'post_id': post_id, 'status': 'found', 'post': posts[post_id]} if post_id in posts else {'post_id': post_id, 'status': 'not_found'}
+            for post_id in post_ids
+        ]
+        return Response({'results': results}, status.HTTP_200_OK)
+
+
 class MangePost(APIView):
     '''Update and delete a post'''
 
@@ -108,9 +342,81 @@ class MangePost(APIView):
         if post.user_id != user.id:
             return Response({"message": "Not Found"}, status.HTTP_404_NOT_FOUND)
         
-        # Delete the post
-        post.delete()
+        # Delete the post, uncount it from the rollups and invalidate the cached responses
+        with transaction.atomic():
+            record_changes(old_rows=[post_values(post)])
+            post.delete()
+        bump_generation()
 
         # Return a success message in the response
         return Response({"message":"post deleted"}, status.HTTP_204_NO_CONTENT)
 
+
+class Stats(APIView):
+    '''Serve the precomputed statistics: posts per type per hour, the most commented stories and the top authors by score'''
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    @staticmethod
+    def cache_params(request, **kwargs):
+        # The hourly window ends at the current hour, so a new hour is a new response
+        return dict(request.query_params.lists(), hour=[hour_of(timezone.now()).isoformat()], accept=[request.META.get('HTTP_ACCEPT', '')])
+
+    # Answer with a 304 while no write moved the rollups, otherwise serve the stats from the cache
+    @method_decorator(condition(**conditional('stats', cache_params)))
+    def get(self, request):
+        generation, _ = generation_state(request)
+        data = get_or_compute('stats', self.cache_params(request), lambda: self.get_stats(request), generation)
+        return Response(data, status.HTTP_200_OK)
+
+    def get_stats(self, request):
+        # The last `hours` hours of counts, and the first `limit` stories and authors
+        try:
+            hours = min(max(int(request.query_params.get('hours', 24)), 1), settings.STATS_MAX_HOURS)
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), settings.API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ValidationError({'detail': 'hours and limit must be numbers'})
+
+        # Every list is a range or top-N scan of a rollup table's index, never of the posts table
+        since = hour_of(timezone.now()) - timedelta(hours=hours - 1)
+        hourly = HourlyTypeCount.objects.filter(hour__gte=since, posts__gt=0).order_by('hour', 'type')
+        stories = list(StoryCommentCount.objects.filter(comments__gt=0).order_by('-comments', 'story_id')[:limit])
+        authors = Author.objects.order_by('-score', 'name')[:limit]
+
+        # The stories' titles, with one IN query on the unique post_id index
+        titles = dict(HackerNewsPost.objects.filter(post_id__in=[story.story_id for story in stories]).values_list('post_id', 'title'))
+        return {
+            'posts_per_hour': HourlyTypeCountSerializer(hourly, many=True).data,
+            'top_stories': StoryCommentCountSerializer(stories, many=True, context={'titles': titles}).data,
+            'top_authors': AuthorSerializer(authors, many=True).data,
+        }
+
+
+class ExportPosts(APIView):
+    '''Stream posts and comments as NDJSON, gzipped when the client accepts it'''
+
+    def get(self, request):
+        # Same filters as the export_posts command
+        try:
+            since = parse_since(request.query_params['since']) if request.query_params.get('since') else None
+        except ValueError as error:
+            raise ValidationError({'since': str(error)})
+        queryset = export_queryset(request.query_params.getlist('type'), since, request.query_params.get('source'))
+
+        # Rows are read and encoded chunk by chunk while the response is sent
+        chunks = iter_ndjson(queryset)
+        gzipped = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        response = StreamingHttpResponse(gzip_stream(chunks) if gzipped else chunks, content_type='application/x-ndjson')
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+        response['Content-Disposition'] = 'attachment; filename="posts.ndjson"'
+        return response
+
+
+class IngestionMetrics(APIView):
+    '''Expose the ingestion job metrics in the Prometheus text format'''
+    permission_classes = [IsAdminUser] # Only staff users (or a scraper with a staff token) can read the metrics
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        return Response(render_prometheus(), status.HTTP_200_OK)
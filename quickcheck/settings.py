@@ -88,6 +88,19 @@ DATABASES = {
 }
 
 
+# Cache
+# Responses are versioned by the data generation, so the timeout only bounds how long entries of old versions linger
+CACHE_URL = os.environ.get('CACHE_URL') # e.g. redis://localhost:6379/0 to share the cache between processes (needs the redis package)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache' if CACHE_URL else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': CACHE_URL or 'quickcheck',
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 3600)),
+        'KEY_PREFIX': 'quickcheck',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -145,6 +158,37 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Hacker News API
+HN_API_URL = os.environ.get('HN_API_URL', 'https://hacker-news.firebaseio.com/v0')
+HN_FETCH_CONCURRENCY = int(os.environ.get('HN_FETCH_CONCURRENCY', 16)) # Maximum number of items fetched at once
+HN_FETCH_MIN_CONCURRENCY = int(os.environ.get('HN_FETCH_MIN_CONCURRENCY', 4)) # Starting and lowest limit of the adaptive concurrency
+HN_FETCH_TARGET_LATENCY = float(os.environ.get('HN_FETCH_TARGET_LATENCY', 1)) # Slower responses make the fetcher back off
+HN_FETCH_TIMEOUT = float(os.environ.get('HN_FETCH_TIMEOUT', 10)) # Seconds to wait for each item before giving up
+HN_FETCH_RETRIES = int(os.environ.get('HN_FETCH_RETRIES', 3)) # Retries of a failed request before it counts as a failure
+HN_FETCH_BACKOFF = float(os.environ.get('HN_FETCH_BACKOFF', 0.5)) # Base seconds of the jittered exponential backoff
+HN_CIRCUIT_THRESHOLD = int(os.environ.get('HN_CIRCUIT_THRESHOLD', 20)) # Consecutive failures that pause a job
+HN_CIRCUIT_COOLDOWN = float(os.environ.get('HN_CIRCUIT_COOLDOWN', 60)) # Seconds the circuit stays open
+HN_FETCH_PROCESSES = int(os.environ.get('HN_FETCH_PROCESSES', 1)) # Processes sharing the fetch work; 1 fetches in the calling process
+HN_FETCH_SHARD_SIZE = int(os.environ.get('HN_FETCH_SHARD_SIZE', 200)) # Items handed to a fetch process at a time
+HN_UPSERT_BATCH_SIZE = int(os.environ.get('HN_UPSERT_BATCH_SIZE', 500)) # Number of items written per transaction
+HN_CRAWL_MAX_DEPTH = int(os.environ.get('HN_CRAWL_MAX_DEPTH', 10)) # Comment levels fetched below each post
+HN_CRAWL_MAX_ATTEMPTS = int(os.environ.get('HN_CRAWL_MAX_ATTEMPTS', 5)) # Failed fetches before a comment is dropped from the crawl frontier
+HN_CRAWL_RETRY_DELAY = float(os.environ.get('HN_CRAWL_RETRY_DELAY', 300)) # Seconds before a failed comment is fetched again, doubled after each failure
+HN_HOT_GRAVITY = float(os.environ.get('HN_HOT_GRAVITY', 1.8)) # How fast the hot ranking decays with age
+HN_HOT_WINDOW_DAYS = int(os.environ.get('HN_HOT_WINDOW_DAYS', 7)) # Posts older than this leave the hot ranking
+HN_SYNC_MODE = os.environ.get('HN_SYNC_MODE', 'incremental') # 'incremental' fetches only new or changed items, 'full' refetches the top 100
+INGESTION_RUN_RETENTION = int(os.environ.get('INGESTION_RUN_RETENTION', 1000)) # Metrics of the latest runs kept per job
+
+# API pagination
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50)) # Posts per page when the client doesn't ask for a size
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 200)) # Largest page_size a client can request
+API_MAX_BATCH_SIZE = int(os.environ.get('API_MAX_BATCH_SIZE', 500)) # Posts created or fetched at most by one batch request
+HOME_MAX_PAGES = int(os.environ.get('HOME_MAX_PAGES', 50)) # Numbered homepage pages; older posts are browsed with a cursor
+COMMENT_TREE_MAX_DEPTH = int(os.environ.get('COMMENT_TREE_MAX_DEPTH', 8)) # Reply levels shown below a post on its detail page
+COMMENT_TREE_CHUNK_SIZE = int(os.environ.get('COMMENT_TREE_CHUNK_SIZE', 500)) # Parent ids per query when loading a level of a thread, well under SQLite's bound variable limit
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000)) # Rows read from the database and written per chunk of an export
+STATS_MAX_HOURS = int(os.environ.get('STATS_MAX_HOURS', 24 * 30)) # Longest window of hourly counts the stats endpoint serves
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
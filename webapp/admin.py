@@ -1,5 +1,35 @@
 from django.contrib import admin
+from django.db import transaction
 
-from webapp.models import HackerNewsPost
+from webapp.cache import bump_generation
+from webapp.models import HackerNewsPost, IngestionRun, IngestionTotal, SyncState
+from webapp.rollups import ROLLUP_FIELDS, post_values, record_changes
 
-admin.site.register(HackerNewsPost)
\ No newline at end of file
+
+class HackerNewsPostAdmin(admin.ModelAdmin):
+    '''Posts edited in the admin move the rollups and invalidate the cached responses like any other write'''
+
+    def save_model(self, request, obj, form, change):
+        old_rows = HackerNewsPost.objects.filter(pk=obj.pk).values(*ROLLUP_FIELDS) if change else []
+        with transaction.atomic():
+            record_changes(list(old_rows), [post_values(obj)])
+            super().save_model(request, obj, form, change)
+        bump_generation()
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            record_changes(old_rows=[post_values(obj)])
+            super().delete_model(request, obj)
+        bump_generation()
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            record_changes(old_rows=list(queryset.values(*ROLLUP_FIELDS)))
+            super().delete_queryset(request, queryset)
+        bump_generation()
+
+
+admin.site.register(HackerNewsPost, HackerNewsPostAdmin)
+admin.site.register(SyncState)
+admin.site.register(IngestionRun)
+admin.site.register(IngestionTotal)
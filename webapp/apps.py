@@ -4,7 +4,3 @@ from django.apps import AppConfig
 class WebappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'webapp'
-
-    def ready(self):
-        from webapp.tasks import schedule_job
-        schedule_job()
\ No newline at end of file
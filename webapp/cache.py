@@ -0,0 +1,163 @@
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from webapp.models import DataGeneration
+
+# Generation shared by every view derived from the posts table
+POSTS_GENERATION = 'posts'
+
+# Views whose responses are cached, as reported on the metrics endpoint
+CACHED_VIEWS = ['home', 'post_detail', 'all_posts', 'one_post', 'top_posts', 'user_posts', 'stats']
+
+
+def current_generation(name=POSTS_GENERATION):
+    return generation_state(name=name)[0]
+
+
+def generation_state(request=None, name=POSTS_GENERATION):
+    '''The data generation and the time it last changed, read once per request'''
+    state = getattr(request, 'data_generation', None)
+    if state is None:
+        state = DataGeneration.objects.filter(name=name).values_list('value', 'changed_at').first() or (0, None)
+        if request is not None:
+            request.data_generation = state
+    return state
+
+
+async def ageneration_state(request=None, name=POSTS_GENERATION):
+    '''generation_state for async views, read with the async ORM'''
+    state = getattr(request, 'data_generation', None)
+    if state is None:
+        state = await DataGeneration.objects.filter(name=name).values_list('value', 'changed_at').afirst() or (0, None)
+        if request is not None:
+            request.data_generation = state
+    return state
+
+
+def bump_generation(name=POSTS_GENERATION):
+    '''Invalidate every cached response built from the current data; call after each write'''
+    # Stored in the database rather than the cache so every process sees the bump, even with a local memory cache
+    now = timezone.now()
+    if not DataGeneration.objects.filter(name=name).update(value=F('value') + 1, changed_at=now):
+        DataGeneration.objects.get_or_create(name=name, defaults={'value': 1, 'changed_at': now})
+
+
+def params_digest(params):
+    # Normalize the parameters so equivalent requests share an entry: order doesn't matter, empty values don't count
+    normalized = sorted(
+        (key, sorted(str(value) for value in values))
+        for key, values in params.items()
+        if any(value not in ('', None) for value in values)
+    )
+    return hashlib.sha1(json.dumps(normalized).encode()).hexdigest()
+
+
+def cache_key(view, params, generation):
+    return f'response:{view}:{generation}:{params_digest(params)}'
+
+
+def conditional(view, get_params):
+    '''
+    Arguments for django.views.decorators.http.condition: an ETag and a Last-Modified date taken from the
+    data generation, so unchanged responses are answered with a 304 before any query or serialization
+    '''
+    def etag(request, *args, **kwargs):
+        generation, _ = generation_state(request)
+        return f'"{view}-{generation}-{params_digest(get_params(request, **kwargs))}"'
+
+    def last_modified(request, *args, **kwargs):
+        return generation_state(request)[1]
+
+    return {'etag_func': etag, 'last_modified_func': last_modified}
+
+
+def async_conditional(view, get_params):
+    '''
+    Decorator giving the get method of an async view what condition(**conditional(...)) gives a sync one;
+    Django's condition decorator only supports async views from 5.0
+    '''
+    functions = conditional(view, get_params)
+
+    def decorator(method):
+        @wraps(method)
+        async def inner(self, request, *args, **kwargs):
+            # Read the generation with the async ORM; the ETag and Last-Modified functions reuse it
+            await ageneration_state(request)
+            etag = quote_etag(functions['etag_func'](request, *args, **kwargs))
+            changed_at = functions['last_modified_func'](request, *args, **kwargs)
+            last_modified = int(changed_at.timestamp()) if changed_at else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await method(self, request, *args, **kwargs)
+
+            # Like condition(), send the validators with every answer to a safe request
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+def count(view, outcome):
+    # Hit and miss counters live in the cache too, so a shared backend aggregates them across processes
+    key = f'response-stats:{outcome}:{view}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_or_compute(view, params, compute, generation=None):
+    '''Return the cached value for the view and request parameters, computing and caching it on a miss'''
+    generation = current_generation() if generation is None else generation
+    key = cache_key(view, params, generation)
+    value = cache.get(key)
+    if value is not None:
+        count(view, 'hits')
+        return value
+
+    count(view, 'misses')
+    value = compute()
+    cache.set(key, value)
+    return value
+
+
+async def acount(view, outcome):
+    # The async cache API emulates incr with a get and a set, which races and resets the counter's timeout
+    await sync_to_async(count)(view, outcome)
+
+
+async def aget_or_compute(view, params, compute, generation=None):
+    '''get_or_compute for async views, where `compute` returns an awaitable; the cache entries are shared'''
+    generation = (await ageneration_state())[0] if generation is None else generation
+    key = cache_key(view, params, generation)
+    value = await cache.aget(key)
+    if value is not None:
+        await acount(view, 'hits')
+        return value
+
+    await acount(view, 'misses')
+    value = await compute()
+    await cache.aset(key, value)
+    return value
+
+
+def cache_stats():
+    '''Hit and miss counts of every cached view'''
+    counts = cache.get_many([f'response-stats:{outcome}:{view}' for view in CACHED_VIEWS for outcome in ['hits', 'misses']])
+    return {
+        view: {outcome: counts.get(f'response-stats:{outcome}:{view}', 0) for outcome in ['hits', 'misses']}
+        for view in CACHED_VIEWS
+    }
@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from webapp.ingest import COMMENT_FIELDS, upsert_items
+from webapp.metrics import JobMetrics
+from webapp.models import CrawlFrontier, HackerNewsPost
+from webapp.utils import chunked
+
+
+def enqueue_kids(kids, batch_size):
+    '''
+    Queue (item_id, depth, refreshed_at) kids and return how many were queued: kids not stored yet, and stored
+    kids older than `refreshed_at`, the time their parent changed, as they may have new replies of their own.
+    Kids whose refreshed_at is None are only queued if missing
+    '''
+    queued = 0
+    for chunk in chunked(kids, batch_size):
+        stored = dict(HackerNewsPost.objects.filter(post_id__in=[item_id for item_id, _, _ in chunk]).values_list('post_id', 'modified'))
+        entries = [
+            CrawlFrontier(item_id=item_id, depth=depth) for item_id, depth, refreshed_at in chunk
+            if item_id not in stored or (refreshed_at is not None and stored[item_id] < refreshed_at)
+        ]
+        CrawlFrontier.objects.bulk_create(entries, ignore_conflicts=True)
+        queued += len(entries)
+    return queued
+
+
+def seed_frontier(state, max_depth=None, batch_size=None):
+    '''Queue the kids of every post or comment ingested since the last seed, one level below it'''
+    max_depth = max_depth or settings.HN_CRAWL_MAX_DEPTH
+    batch_size = batch_size or settings.HN_UPSERT_BATCH_SIZE
+    started = timezone.now()
+
+    # Only items written since the last checkpoint can have new kids. Comments at the depth limit, or whose depth in
+    # their thread isn't known yet, are left out
+    posts = HackerNewsPost.objects.filter(source='Hacker API', kids__isnull=False).filter(
+        Q(parent__isnull=True) | Q(depth__lt=max_depth),
+    )
+    if state.checkpoint:
+        posts = posts.filter(modified__gte=state.checkpoint)
+
+    def kids():
+        for post_kids, depth, modified in posts.values_list('kids', 'depth', 'modified').iterator(chunk_size=batch_size):
+            for kid in post_kids or []:
+                yield kid, (depth or 0) + 1, modified
+
+    # Seed the frontier and move the checkpoint in one transaction so a crash can't lose either
+    with transaction.atomic():
+        seeded = enqueue_kids(kids(), batch_size)
+        state.checkpoint = started
+        state.save()
+    return seeded
+
+
+def due_entries():
+    # Frontier entries to fetch now; the ones that failed wait out their backoff, so a run doesn't fetch them twice
+    return CrawlFrontier.objects.filter(Q(retry_after__isnull=True) | Q(retry_after__lte=timezone.now()))
+
+
+def retry_later(entries):
+    # Back off each failed entry exponentially; one that keeps failing (e.g. a deleted item) is dropped
+    retried = []
+    for entry in entries:
+        entry.attempts += 1
+        if entry.attempts < settings.HN_CRAWL_MAX_ATTEMPTS:
+            entry.retry_after = timezone.now() + timedelta(seconds=settings.HN_CRAWL_RETRY_DELAY * 2 ** (entry.attempts - 1))
+            retried.append(entry)
+        else:
+            print(f'Giving up on item {entry.item_id} after {entry.attempts} failed fetches')
+    CrawlFrontier.objects.bulk_update(retried, ['attempts', 'retry_after'])
+    CrawlFrontier.objects.filter(id__in=[entry.id for entry in entries if entry.retry_after is None]).delete()
+
+
+def crawl_frontier(client, max_depth=None, batch_size=None, metrics=None):
+    '''Fetch the frontier breadth first, queueing the kids of every fetched comment'''
+    max_depth = max_depth or settings.HN_CRAWL_MAX_DEPTH
+    batch_size = batch_size or settings.HN_UPSERT_BATCH_SIZE
+    metrics = metrics or JobMetrics('get_children')
+    stats = {'fetched': 0, 'written': 0, 'queued': 0, 'fetch_errors': 0, 'paused': False}
+    due = due_entries()
+    while True:
+        # Shallowest entries first, so the tree is walked level by level
+        batch = list(due.order_by('depth', 'item_id')[:batch_size])
+        if not batch:
+            break
+        depths = {entry.item_id: entry.depth for entry in batch}
+        metrics.observe_queue_depth(CrawlFrontier.objects.count())
+
+        # Stored comments are queued too when their parent changed: fetching them again finds their new replies
+        items = list(client.fetch_items(depths))
+        paused = client.breaker.is_open()
+
+        # Write the batch and advance the frontier together so an interrupted run resumes here
+        with metrics.timer('db_write'), transaction.atomic():
+            written_ids = set()
+            stats['written'] += upsert_items(items, COMMENT_FIELDS, batch_size, written_ids=written_ids)
+
+            # Queue the next level below every fetched comment, unless it is at the depth limit. The stored kids
+            # of a comment that changed are fetched again too
+            refreshed_at = timezone.now()
+            kids = [
+                (kid, depths[item['id']] + 1, refreshed_at if item['id'] in written_ids else None)
+                for item in items if depths[item['id']] < max_depth
+                for kid in item.get('kids') or []
+            ]
+            stats['queued'] += enqueue_kids(kids, batch_size)
+
+            # Only fetched ids leave the frontier. If the circuit breaker opened, the ids it cut off stay queued as
+            # they were; otherwise the ones that failed are retried later, until they run out of attempts
+            fetched_ids = {item['id'] for item in items}
+            CrawlFrontier.objects.filter(item_id__in=fetched_ids).delete()
+            if not paused:
+                failed = [entry for entry in batch if entry.item_id not in fetched_ids]
+                stats['fetch_errors'] += len(failed)
+                retry_later(failed)
+
+        stats['fetched'] += len(items)
+        if paused:
+            stats['paused'] = True
+            break
+    return stats
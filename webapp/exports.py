@@ -0,0 +1,82 @@
+import zlib
+from datetime import datetime, time, timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date, parse_datetime
+
+from webapp.models import HackerNewsPost
+
+# Columns written for every exported post or comment
+EXPORT_FIELDS = [
+    'post_id', 'parent_id', 'type', 'by', 'time', 'title', 'text', 'url',
+    'score', 'descendants', 'kids', 'source', 'modified',
+]
+
+
+def parse_since(value):
+    '''Parse the `since` filter: an ISO 8601 datetime or date, or a unix timestamp'''
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value), tz=timezone.utc)
+    moment = parse_datetime(value)
+    if moment is None and (day := parse_date(value)):
+        moment = datetime.combine(day, time.min)
+    if moment is None:
+        raise ValueError(f'since must be an ISO 8601 datetime or date, or a unix timestamp, not {value!r}')
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def export_queryset(types=None, since=None, source=None):
+    '''Posts and comments to export, as rows of the primary key then EXPORT_FIELDS, in primary key order'''
+    posts = HackerNewsPost.objects.all()
+    if types:
+        posts = posts.filter(type__in=types)
+    if since:
+        # Rows created or changed since the given moment, so mirrors can sync incrementally
+        posts = posts.filter(modified__gte=since)
+    if source:
+        posts = posts.filter(source=source)
+    return posts.order_by('id').values_list('id', *EXPORT_FIELDS)
+
+
+def iter_ndjson(queryset, chunk_size=None):
+    '''Yield the rows as NDJSON, a chunk of lines at a time, without loading the queryset into memory'''
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    last_id = 0
+    while True:
+        # One short keyset query per chunk: no cursor, and on SQLite no read lock, is held while a slow client
+        # downloads the chunk, so the sync jobs can keep writing
+        rows = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield ('\n'.join(encoder.encode(dict(zip(EXPORT_FIELDS, row[1:]))) for row in rows) + '\n').encode()
+
+
+def accepts_gzip(accept_encoding):
+    '''Whether an Accept-Encoding header allows a gzipped response: gzip, or else *, with a non-zero q-value'''
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                # A malformed weight doesn't make the coding acceptable
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0)) > 0
+
+
+def gzip_stream(chunks, level=6):
+    '''Gzip a stream of byte chunks on the fly'''
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
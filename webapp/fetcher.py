@@ -0,0 +1,260 @@
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from webapp.utils import Histogram, chunked
+
+# Client owned by each process of a sharded fetch, so workers keep their connections between shards
+_shard_client = None
+
+
+def _init_shard_worker(base_url, concurrency, timeout):
+    global _shard_client
+    # Each worker fetches its shard with threads only; it must not start a process pool of its own
+    _shard_client = HackerNewsClient(base_url, concurrency, timeout, processes=1)
+
+
+def _fetch_shard(item_ids):
+    # Return the shard's items, whether the worker's circuit breaker opened, the latencies it measured and the ids
+    # the API had no item for
+    _shard_client.latency = Histogram()
+    _shard_client.missing_ids = set()
+    items = list(_shard_client.fetch_items(item_ids))
+    return items, _shard_client.breaker.is_open(), _shard_client.latency, _shard_client.missing_ids
+
+
+class CircuitOpenError(Exception):
+    '''Raised instead of calling the API while the circuit breaker is open'''
+
+
+class CircuitBreaker:
+    '''Stop calling the API after too many consecutive failures, until a cooldown has passed'''
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or settings.HN_CIRCUIT_THRESHOLD
+        self.cooldown = cooldown or settings.HN_CIRCUIT_COOLDOWN
+        self.failures = 0
+        self.opened_at = None
+        # Every fetch thread reports to the same breaker
+        self.lock = threading.Lock()
+
+    def is_open(self):
+        # After the cooldown the breaker is half-open: calls go through and one more failure reopens it
+        opened_at = self.opened_at
+        return opened_at is not None and time.monotonic() - opened_at < self.cooldown
+
+    def trip(self):
+        with self.lock:
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class AdaptiveLimiter:
+    '''Additive-increase/multiplicative-decrease limit on the number of requests in flight'''
+
+    def __init__(self, minimum, maximum, target_latency):
+        self.minimum = min(minimum, maximum)
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.limit = self.minimum
+        self.successes = 0
+        self.since_decrease = 0
+        # The counters move together, so a limiter shared between threads updates them under a lock
+        self.lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.since_decrease += 1
+            if ok and latency <= self.target_latency:
+                # Healthy response: grow by one after a full window of successes
+                self.successes += 1
+                if self.successes >= self.limit:
+                    self.limit = min(self.maximum, self.limit + 1)
+                    self.successes = 0
+            elif self.since_decrease >= self.limit:
+                # Error or latency spike: halve, at most once per window so one burst doesn't collapse the limit
+                self.limit = max(self.minimum, self.limit // 2)
+                self.successes = 0
+                self.since_decrease = 0
+
+
+class HackerNewsClient:
+    '''Fetch items from the Hacker News API over a shared, connection-pooled session'''
+
+    def __init__(self, base_url=None, concurrency=None, timeout=None, processes=None):
+        self.base_url = (base_url or settings.HN_API_URL).rstrip('/')
+        self.concurrency = concurrency or settings.HN_FETCH_CONCURRENCY
+        self.timeout = timeout or settings.HN_FETCH_TIMEOUT
+        self.processes = processes or settings.HN_FETCH_PROCESSES
+        self.process_pool = None
+        self.retries = settings.HN_FETCH_RETRIES
+        self.backoff = settings.HN_FETCH_BACKOFF
+        self.breaker = CircuitBreaker()
+
+        # Measurements picked up by the job metrics
+        self.latency = Histogram()
+        self.wait_seconds = 0.0
+        # Ids the API answered null for, e.g. deleted items, as opposed to ones that failed to fetch
+        self.missing_ids = set()
+
+        # Keep one keep-alive connection per worker thread so requests reuse sockets
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+        if self.process_pool:
+            self.process_pool.shutdown()
+            self.process_pool = None
+
+    def get(self, path):
+        # Make an API call and return the parsed JSON body, retrying transient failures
+        for attempt in range(self.retries + 1):
+            if self.breaker.is_open():
+                raise CircuitOpenError(f'Circuit open after {self.breaker.failures} consecutive failures')
+            try:
+                response = self.session.get(f'{self.base_url}/{path}.json', timeout=self.timeout)
+                response.raise_for_status()
+                body = response.json()
+            except (requests.RequestException, ValueError) as error:
+                # Client errors other than rate limiting won't succeed on a retry
+                status = getattr(error.response, 'status_code', None) if isinstance(error, requests.RequestException) else None
+                if attempt == self.retries or (status and 400 <= status < 500 and status != 429):
+                    self.breaker.record_failure()
+                    raise
+                # Exponential backoff with full jitter so retries from many threads don't synchronise
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            else:
+                self.breaker.record_success()
+                return body
+
+    def top_stories(self):
+        return self.get('topstories') or []
+
+    def max_item(self):
+        return self.get('maxitem') or 0
+
+    def updates(self):
+        # Items and profiles changed upstream in the last few minutes
+        return self.get('updates') or {}
+
+    def item(self, item_id):
+        return self.get(f'item/{item_id}')
+
+    def timed_item(self, item_id):
+        started = time.monotonic()
+        item = self.item(item_id)
+        return item, time.monotonic() - started
+
+    def wait_for(self, futures):
+        # Block until at least one request finishes, counting the time as network wait
+        started = time.perf_counter()
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        self.wait_seconds += time.perf_counter() - started
+        return done
+
+    def fetch_items(self, item_ids):
+        '''Yield parsed items as they arrive, in completion order; stops early if the circuit breaker opens'''
+        if self.processes > 1:
+            yield from self.fetch_sharded(item_ids)
+            return
+
+        item_ids = iter(item_ids)
+        limiter = AdaptiveLimiter(settings.HN_FETCH_MIN_CONCURRENCY, self.concurrency, settings.HN_FETCH_TARGET_LATENCY)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = {}
+
+            def submit_next():
+                # Only keep as many requests in flight as the adaptive limit allows
+                if self.breaker.is_open():
+                    return
+                for item_id in item_ids:
+                    pending[executor.submit(self.timed_item, item_id)] = item_id
+                    if len(pending) >= limiter.limit:
+                        break
+
+            submit_next()
+            while pending:
+                done = self.wait_for(pending)
+                for future in done:
+                    item_id = pending.pop(future)
+                    try:
+                        item, latency = future.result()
+                    except CircuitOpenError:
+                        continue
+                    except (requests.RequestException, ValueError) as error:
+                        # A single failing item must not stop the whole job
+                        limiter.record(self.timeout, ok=False)
+                        print(f'Failed to fetch item {item_id}: {error}')
+                        continue
+                    limiter.record(latency, ok=True)
+                    self.latency.observe(latency)
+                    if not item:
+                        print(f'No response of id {item_id}')
+                        self.missing_ids.add(item_id)
+                        continue
+                    yield item
+                submit_next()
+
+            if self.breaker.is_open():
+                print(f'Circuit open after {self.breaker.failures} consecutive failures, pausing the fetch')
+
+    def fetch_sharded(self, item_ids):
+        '''Split the ids into shards fetched by a pool of processes, each with its own thread pool'''
+        if self.process_pool is None:
+            # Spawn fresh interpreters so workers don't inherit the scheduler's threads or DB connections
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_shard_worker,
+                initargs=(self.base_url, self.concurrency, self.timeout),
+            )
+
+        shards = chunked(item_ids, settings.HN_FETCH_SHARD_SIZE)
+        pending = set()
+
+        def submit_next():
+            # Keep every process busy with one shard queued behind the one it is fetching
+            for shard in shards:
+                pending.add(self.process_pool.submit(_fetch_shard, shard))
+                if len(pending) >= self.processes * 2:
+                    break
+
+        submit_next()
+        while pending:
+            done = self.wait_for(pending)
+            for future in done:
+                pending.remove(future)
+                items, paused, latency, missing_ids = future.result()
+                self.latency.merge(latency)
+                self.missing_ids |= missing_ids
+                if paused:
+                    # One worker hit the breaker: stop handing out shards
+                    self.breaker.trip()
+                yield from items
+            if not self.breaker.is_open():
+                submit_next()
@@ -0,0 +1,105 @@
+import hashlib
+import json
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from webapp.models import HackerNewsPost
+from webapp.ranking import rank
+from webapp.rollups import ROLLUP_FIELDS, record_changes
+from webapp.threads import assign_stories
+from webapp.utils import chunked
+
+
+# Fields owned by each sync job, overwritten whenever an item is ingested again
+STORY_FIELDS = ['by', 'kids', 'score', 'descendants', 'time', 'title', 'text', 'type', 'url', 'source']
+COMMENT_FIELDS = ['by', 'kids', 'text', 'type', 'time', 'parent', 'source']
+
+
+def existing_post_ids(item_ids):
+    # Return which of the given Hacker News ids are already stored, using the unique post_id index
+    posts = HackerNewsPost.objects.filter(post_id__in=list(item_ids))
+    return set(posts.values_list('post_id', flat=True))
+
+
+def content_hash(item, fields):
+    # Stable fingerprint of the fields a job owns, so unchanged items can be detected before writing
+    content = json.dumps({field: item.get(field) for field in fields}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def item_to_post(item, fields):
+    # Build an unsaved post from a Hacker News item, keeping only the fields the job owns
+    data = {field: item.get(field) for field in fields}
+    data['source'] = 'Hacker API'
+    data['content_hash'] = content_hash(item, fields)
+
+    # The API returns unix timestamps and parent ids; store them as a datetime and a relation
+    if data.get('time') is not None:
+        data['time'] = datetime.fromtimestamp(data['time'], tz=timezone.utc)
+    if 'parent' in data:
+        data['parent_id'] = data.pop('parent')
+    return HackerNewsPost(post_id=item['id'], **data)
+
+
+def upsert_items(items, fields, batch_size=None, metrics=None, written_ids=None):
+    '''
+    Insert or update items in chunks, one transaction per chunk, and return the number of rows written;
+    the ids of the written rows are added to the `written_ids` set, if given
+    '''
+    batch_size = batch_size or settings.HN_UPSERT_BATCH_SIZE
+    written = 0
+    for chunk in chunked(items, batch_size):
+        with metrics.timer('db_write') if metrics else nullcontext():
+            post_ids = write_chunk(chunk, fields)
+        written += len(post_ids)
+        if written_ids is not None:
+            written_ids.update(post_ids)
+    return written
+
+
+def write_chunk(chunk, fields):
+    # Keep the last version of each item so a chunk never touches the same row twice
+    posts = {item['id']: item_to_post(item, fields) for item in chunk}
+
+    # Skip items whose fingerprint matches the stored one, so unchanged rows keep their modified time
+    stored_rows = HackerNewsPost.objects.filter(post_id__in=list(posts)).values('content_hash', *ROLLUP_FIELDS)
+    stored = {row['post_id']: row for row in stored_rows}
+    for post_id, row in stored.items():
+        if posts[post_id].content_hash == row['content_hash']:
+            del posts[post_id]
+    if not posts:
+        return []
+
+    update_fields = fields + ['content_hash', 'modified']
+    if 'parent' not in fields:
+        # Top-level items are ranked as they are written; refresh_hot_scores keeps the ranking current as they age
+        for post in posts.values():
+            rank(post)
+        update_fields.append('hot_score')
+    else:
+        # Comments are counted in the rollups of their thread's story, and crawled by their depth in it
+        assign_stories(posts.values())
+        update_fields += ['story_id', 'depth']
+
+    # The rollup columns of each post once written: the job's fields over the stored row, if any
+    written_columns = {HackerNewsPost._meta.get_field(field).attname for field in update_fields} & set(ROLLUP_FIELDS)
+    new_rows = []
+    for post in posts.values():
+        row = dict(stored.get(post.post_id) or dict.fromkeys(ROLLUP_FIELDS))
+        row.update({column: getattr(post, column) for column in written_columns}, post_id=post.post_id)
+        new_rows.append(row)
+
+    with transaction.atomic():
+        HackerNewsPost.objects.bulk_create(
+            posts.values(),
+            update_conflicts=True,
+            unique_fields=['post_id'],
+            update_fields=update_fields,
+        )
+        # Move the statistics rollups in the same transaction as the rows they count
+        record_changes([stored[post_id] for post_id in posts if post_id in stored], new_rows)
+    # The ids of the items written
+    return list(posts)
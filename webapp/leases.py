@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from webapp.models import LeaderLease
+
+
+def acquire_lease(name, holder, ttl):
+    '''Take or renew the named lease for `ttl` seconds and return whether `holder` owns it'''
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl)
+    LeaderLease.objects.get_or_create(name=name, defaults={'holder': holder, 'expires_at': expires_at})
+
+    # A single conditional UPDATE renews our own lease or takes over an expired one, so only one holder can win
+    updated = LeaderLease.objects.filter(Q(holder=holder) | Q(expires_at__lt=now), name=name)
+    return bool(updated.update(holder=holder, expires_at=expires_at))
+
+
+def release_lease(name, holder):
+    # Expire the lease right away so a standby process can take over without waiting for the ttl
+    LeaderLease.objects.filter(name=name, holder=holder).update(expires_at=timezone.now())
@@ -0,0 +1,168 @@
+import asyncio
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from webapp.management.commands.benchmark_serializers import populate
+from webapp.models import HackerNewsPost
+
+# Each endpoint's sync view, served under WSGI, and its async variant, served under ASGI
+ENDPOINTS = [
+    ('all posts', '/api/all-posts/', '/api/async/all-posts/'),
+    ('one post', '/api/post/1/', '/api/async/post/1/'),
+    ('post detail', '/post/{pk}/', '/async/post/{pk}/'),
+]
+
+
+def split(total, parts):
+    # Share `total` requests between `parts` clients
+    return [total // parts + (index < total % parts) for index in range(parts)]
+
+
+def summarize(results, elapsed):
+    # Throughput and latency percentiles of (latency, succeeded) results
+    latencies = [latency for latency, _ in results]
+    return {
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p99_ms': round(statistics.quantiles(latencies, n=100)[98] * 1000, 1),
+        'errors': sum(not succeeded for _, succeeded in results),
+    }
+
+
+def wsgi_environ(path):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'testserver', 'SERVER_PORT': '80',
+        'HTTP_HOST': 'testserver', 'HTTP_ACCEPT': 'application/json', 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    }
+
+
+def serve_wsgi(app, path, client_delay):
+    # One request on a worker thread; a slow client holds the thread until it has read the response
+    statuses = []
+    body = app(wsgi_environ(path), lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+        time.sleep(client_delay)
+    finally:
+        body.close()
+    return statuses[0].startswith('200')
+
+
+def run_wsgi(path, requests, concurrency, threads, client_delay):
+    '''`concurrency` clients sending `requests` requests in total to a WSGI server with `threads` worker threads'''
+    app = get_wsgi_application()
+    results = []
+
+    with ThreadPoolExecutor(threads) as server:
+        def client(count):
+            for _ in range(count):
+                started = time.perf_counter()
+                succeeded = server.submit(serve_wsgi, app, path, client_delay).result()
+                results.append((time.perf_counter() - started, succeeded))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as clients:
+            list(clients.map(client, split(requests, concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(results, elapsed)
+
+
+async def serve_asgi(app, path, client_delay):
+    # One request on the event loop; a slow client only suspends its own coroutine while it reads
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'accept', b'application/json')],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    statuses = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif not message.get('more_body'):
+            await asyncio.sleep(client_delay)
+
+    await app(scope, receive, send)
+    return statuses[0] == 200
+
+
+async def run_asgi(path, requests, concurrency, client_delay):
+    '''`concurrency` clients sending `requests` requests in total to an ASGI server with a single event loop'''
+    app = get_asgi_application()
+    results = []
+
+    async def client(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            succeeded = await serve_asgi(app, path, client_delay)
+            results.append((time.perf_counter() - started, succeeded))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(count) for count in split(requests, concurrency)))
+    return summarize(results, time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync read views under WSGI with their async variants under ASGI on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10_000, help='Stories in the database')
+        parser.add_argument('--comments', type=int, default=200, help='Comments in the thread of the benchmarked post')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests sent to each endpoint')
+        parser.add_argument('--concurrency', type=int, default=200, help='Clients sending requests at the same time')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads of the WSGI server')
+        parser.add_argument('--client-delay', type=float, default=0.05, help='Seconds a slow client takes to read a response')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the response cache so every request queries the database')
+
+    def handle(self, *args, **options):
+        overrides = {'DEBUG': False}
+        if options['no_cache']:
+            # Entries expire as they are stored; the hit and miss counters, stored without a timeout, keep working
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'TIMEOUT': 0}}
+
+        # Requests are handled in process, without a network stack, against a throwaway test database
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(**overrides):
+                pk = self.populate(options['posts'], options['comments'])
+                for name, wsgi_path, asgi_path in ENDPOINTS:
+                    wsgi_path, asgi_path = wsgi_path.format(pk=pk), asgi_path.format(pk=pk)
+                    wsgi = run_wsgi(wsgi_path, options['requests'], options['concurrency'], options['threads'], options['client_delay'])
+                    asgi = asyncio.run(run_asgi(asgi_path, options['requests'], options['concurrency'], options['client_delay']))
+                    self.stdout.write(
+                        f"{name}: WSGI ({options['threads']} threads) {wsgi['requests_per_sec']} req/s, "
+                        f"p50 {wsgi['p50_ms']} ms, p99 {wsgi['p99_ms']} ms, {wsgi['errors']} errors | "
+                        f"ASGI {asgi['requests_per_sec']} req/s, p50 {asgi['p50_ms']} ms, p99 {asgi['p99_ms']} ms, "
+                        f"{asgi['errors']} errors"
+                    )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def populate(self, posts, comments):
+        # The stories, then a thread of replies below the first one, a few replies per comment
+        populate(posts)
+        story = HackerNewsPost.objects.get(post_id=1)
+        HackerNewsPost.objects.bulk_create(
+            HackerNewsPost(
+                post_id=posts + index, parent_id=1 if index <= 5 else posts + index // 5, type='comment',
+                by=f'user{index % 1000}', time=story.time, text='Lorem ipsum dolor sit amet. ' * 4,
+            )
+            for index in range(1, comments + 1)
+        )
+        return story.pk
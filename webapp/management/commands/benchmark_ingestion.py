@@ -0,0 +1,91 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from webapp.management.commands.hn_simulator import add_corpus_arguments, build_corpus
+from webapp.simulator import HackerNewsSimulator
+from webapp.tasks import get_children, make_request
+
+# Metrics where a higher value is a regression; every other metric regresses when it drops
+LOWER_IS_BETTER = {'peak_memory_mb'}
+
+
+def measure(job):
+    # Run one sync job and return its throughput and peak Python memory
+    tracemalloc.start()
+    started = time.perf_counter()
+    stats = job()
+    duration = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'duration': round(duration, 3),
+        'items_per_sec': round(stats['fetched'] / duration, 1),
+        'writes_per_sec': round(stats['written'] / duration, 1),
+        'peak_memory_mb': round(peak / 1024 / 1024, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark make_request and get_children against the local Hacker News simulator'
+
+    def add_arguments(self, parser):
+        add_corpus_arguments(parser)
+        parser.add_argument('--concurrency', type=int, help='Override HN_FETCH_CONCURRENCY')
+        parser.add_argument('--processes', type=int, help='Override HN_FETCH_PROCESSES')
+        parser.add_argument('--save', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Fail if the results regress against this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression against the baseline')
+
+    def handle(self, *args, **options):
+        corpus = build_corpus(options)
+        simulator = HackerNewsSimulator(
+            corpus, latency=options['latency'], jitter=options['jitter'], error_rate=options['error_rate'], seed=0,
+        )
+
+        # Run against a throwaway test database so the benchmark never touches real data
+        overrides = {'HN_API_URL': simulator.url, 'HN_CRAWL_MAX_DEPTH': options['depth'] or 1}
+        if options['concurrency']:
+            overrides['HN_FETCH_CONCURRENCY'] = options['concurrency']
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with simulator, override_settings(**overrides):
+                results = {
+                    'make_request': measure(lambda: make_request(mode='full', processes=options['processes'])),
+                    'get_children': measure(lambda: get_children(processes=options['processes'])),
+                }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        for job, metrics in results.items():
+            self.stdout.write(f'{job}: ' + ', '.join(f'{name}={value}' for name, value in metrics.items()))
+
+        if options['save']:
+            with open(options['save'], 'w') as results_file:
+                json.dump(results, results_file, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = self.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Performance regressed:\n' + '\n'.join(regressions))
+            self.stdout.write('No regressions against the baseline')
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for job, metrics in baseline.items():
+            for name, expected in metrics.items():
+                if name == 'duration' or name not in results.get(job, {}):
+                    continue
+                actual = results[job][name]
+                if name in LOWER_IS_BETTER:
+                    regressed = actual > expected * (1 + tolerance)
+                else:
+                    regressed = actual < expected * (1 - tolerance)
+                if regressed:
+                    regressions.append(f'{job} {name}: {actual} (baseline {expected})')
+        return regressions
@@ -0,0 +1,68 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONRenderer
+from api.serializers import PostSerializer, serialize_rows
+from webapp.models import HackerNewsPost
+
+
+def populate(rows):
+    '''Fill the posts table with `rows` realistically sized stories, with a few hundred bytes of text each'''
+    HackerNewsPost.objects.all().delete()
+    start = datetime(2023, 6, 1, tzinfo=timezone.utc)
+    HackerNewsPost.objects.bulk_create(
+        (
+            HackerNewsPost(
+                post_id=index, by=f'user{index % 1000}', time=start + timedelta(seconds=index), type='story',
+                title=f'Story number {index}', text='Lorem ipsum dolor sit amet. ' * 12,
+                url=f'https://example.com/{index}', source='Hacker API', score=index % 500,
+            )
+            for index in range(1, rows + 1)
+        ),
+        batch_size=2000,
+    )
+
+
+def model_serializer_path(queryset):
+    return JSONRenderer().render(PostSerializer(queryset, many=True).data)
+
+
+def fast_path(queryset):
+    return FastJSONRenderer().render(serialize_rows(queryset.values(*PostSerializer.Meta.fields)))
+
+
+def best_of(repeat, render, queryset):
+    # Best wall time of `repeat` runs, each reading the rows from the database again
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(queryset.all())
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = 'Compare PostSerializer with the fast .values() read path on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000], help='Table sizes to benchmark')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path; the best one is reported')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for rows in options['rows']:
+                populate(rows)
+                queryset = HackerNewsPost.objects.order_by('-time', '-id')
+                slow = best_of(options['repeat'], model_serializer_path, queryset)
+                fast = best_of(options['repeat'], fast_path, queryset)
+                self.stdout.write(
+                    f'{rows} rows: PostSerializer {slow * 1000:.0f} ms ({rows / slow:.0f} rows/sec), '
+                    f'fast path {fast * 1000:.0f} ms ({rows / fast:.0f} rows/sec), {slow / fast:.1f}x faster'
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0)
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.exports import export_queryset, gzip_stream, iter_ndjson, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Export posts and comments as NDJSON, streamed with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', action='append', dest='types', help='Only export this type; repeat for several types')
+        parser.add_argument('--since', help='Only export rows created or changed since this ISO 8601 datetime, date or unix timestamp')
+        parser.add_argument('--source', help="Only export rows from this source, e.g. 'Hacker API' or 'QuickCheck API'")
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, help='Override EXPORT_CHUNK_SIZE')
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since']) if options['since'] else None
+        except ValueError as error:
+            raise CommandError(error)
+
+        queryset = export_queryset(options['types'], since, options['source'])
+        chunks = iter_ndjson(queryset, options['chunk_size'])
+        if options['gzip']:
+            chunks = gzip_stream(chunks)
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from webapp.fetcher import HackerNewsClient
+from webapp.simulator import HackerNewsCorpus, HackerNewsSimulator
+
+
+def add_corpus_arguments(parser):
+    # Options shared by every command that builds a simulator corpus
+    parser.add_argument('--corpus', help='Serve a corpus recorded with --save-corpus instead of a synthetic one')
+    parser.add_argument('--stories', type=int, default=100, help='Number of synthetic top stories')
+    parser.add_argument('--branching', type=int, default=3, help='Kids per item in the synthetic comment trees')
+    parser.add_argument('--depth', type=int, default=2, help='Comment levels below each synthetic story')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random seconds added on top of the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+
+
+def build_corpus(options):
+    if options['corpus']:
+        return HackerNewsCorpus.load(options['corpus'])
+    return HackerNewsCorpus.synthetic(options['stories'], options['branching'], options['depth'])
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Hacker News API; point HN_API_URL at it to load-test the sync jobs'
+
+    def add_arguments(self, parser):
+        add_corpus_arguments(parser)
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--record', action='store_true', help='Record the corpus from the live API (see HN_API_URL) instead of generating it')
+        parser.add_argument('--save-corpus', help='Write the corpus to this file before serving it')
+
+    def handle(self, *args, **options):
+        if options['record']:
+            with HackerNewsClient() as client:
+                corpus = HackerNewsCorpus.record(client, options['stories'], options['depth'])
+        else:
+            corpus = build_corpus(options)
+        if options['save_corpus']:
+            corpus.dump(options['save_corpus'])
+
+        simulator = HackerNewsSimulator(
+            corpus, port=options['port'], latency=options['latency'],
+            jitter=options['jitter'], error_rate=options['error_rate'],
+        )
+        self.stdout.write(f'Serving {len(corpus.items)} items at {simulator.url} (HN_API_URL={simulator.url})')
+        try:
+            simulator.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            simulator.server.server_close()
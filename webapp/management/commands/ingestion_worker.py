@@ -0,0 +1,67 @@
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from webapp.leases import acquire_lease, release_lease
+from webapp.tasks import create_scheduler
+
+LEASE_NAME = 'ingestion-scheduler'
+
+
+class Command(BaseCommand):
+    help = 'Run the Hacker News sync jobs; only the process holding the leader lease schedules them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.HN_FETCH_PROCESSES, help='Processes the fetch work is sharded across')
+        parser.add_argument('--lease-ttl', type=int, default=60, help='Seconds the leader lease stays valid without renewal')
+
+    def handle(self, *args, **options):
+        holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        ttl = options['lease_ttl']
+        scheduler = None
+        self.stdout.write(f'Ingestion worker {holder} started')
+
+        renewed_at = None  # When we last took or renewed the lease, on the monotonic clock
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    is_leader = acquire_lease(LEASE_NAME, holder, ttl)
+                except DatabaseError as error:
+                    # E.g. SQLite "database is locked" while a sync job writes: a failed renewal. Keep scheduling only
+                    # if the lease renewed last can't lapse before the next attempt
+                    self.stderr.write(f'Could not renew the leader lease: {error}')
+                    is_leader = scheduler is not None and time.monotonic() + ttl / 3 < renewed_at + ttl
+                else:
+                    if is_leader:
+                        renewed_at = time.monotonic()
+
+                if is_leader and scheduler is None:
+                    # We became the leader: start scheduling the sync jobs
+                    self.stdout.write('Acquired the leader lease, starting the scheduler')
+                    scheduler = create_scheduler(processes=options['processes'])
+                    scheduler.resume()
+                elif not is_leader and scheduler is not None:
+                    # Another process took over (e.g. we stalled past the ttl), or it may have: stop scheduling right away
+                    self.stdout.write('Lost the leader lease, stopping the scheduler')
+                    scheduler.shutdown(wait=True)
+                    scheduler = None
+
+                # Renew well before the lease expires
+                time.sleep(ttl / 3)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if scheduler is not None:
+                scheduler.shutdown(wait=True)
+            try:
+                release_lease(LEASE_NAME, holder)
+            except DatabaseError:
+                # The lease then expires after its ttl
+                pass
+            self.stdout.write(f'Ingestion worker {holder} stopped')
@@ -0,0 +1,149 @@
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from webapp.cache import cache_stats
+from webapp.models import IngestionRun, IngestionTotal
+from webapp.utils import Histogram
+
+
+class JobMetrics:
+    '''Stage timings, latencies and counters collected during one run of a sync job'''
+
+    def __init__(self, job):
+        self.job = job
+        self.started_at = timezone.now()
+        self.started = time.perf_counter()
+        self.fetch_latency = Histogram()
+        self.stage_seconds = {'fetch_wait': 0.0, 'db_write': 0.0}
+        self.max_queue_depth = 0
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - started
+
+    def observe_queue_depth(self, depth):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_client(self, client):
+        # Collect what the fetcher measured: request latencies and time spent waiting on the network
+        self.fetch_latency.merge(client.latency)
+        self.stage_seconds['fetch_wait'] += client.wait_seconds
+
+    @contextmanager
+    def recording(self):
+        '''
+        Yield the stats dict the job fills in and persist the run when the block exits, whether or not it raised,
+        so failed runs are counted too
+        '''
+        stats = {}
+        failed = True
+        try:
+            yield stats
+            failed = False
+        finally:
+            self.finish(stats, failed=failed)
+
+    def finish(self, stats, failed=False):
+        '''Persist the run, add it to the job's totals and drop the oldest runs beyond the retention limit'''
+        duration = time.perf_counter() - self.started
+
+        # Whatever is not network wait or DB work is spent in Python
+        stage_seconds = {stage: round(seconds, 6) for stage, seconds in self.stage_seconds.items()}
+        stage_seconds['other'] = round(max(duration - sum(self.stage_seconds.values()), 0), 6)
+
+        run = IngestionRun.objects.create(
+            job=self.job,
+            started_at=self.started_at,
+            duration=duration,
+            fetched=stats.get('fetched', 0),
+            skipped=stats.get('skipped', 0),
+            written=stats.get('written', 0),
+            paused=stats.get('paused', False),
+            failed=failed or stats.get('failed', False),
+            max_queue_depth=self.max_queue_depth,
+            stage_seconds=stage_seconds,
+            fetch_latency=self.fetch_latency.as_dict(),
+        )
+
+        # Increment in the database so concurrent runs of a job don't overwrite each other's counts
+        IngestionTotal.objects.get_or_create(job=self.job)
+        IngestionTotal.objects.filter(job=self.job).update(
+            runs=F('runs') + 1, failed_runs=F('failed_runs') + int(run.failed), fetched=F('fetched') + run.fetched,
+            skipped=F('skipped') + run.skipped, written=F('written') + run.written, seconds=F('seconds') + duration,
+        )
+
+        # The totals above keep counting what pruned runs did
+        expired = IngestionRun.objects.filter(job=self.job).order_by('-started_at')[settings.INGESTION_RUN_RETENTION:]
+        IngestionRun.objects.filter(id__in=list(expired.values_list('id', flat=True))).delete()
+        return run
+
+
+def prometheus_metric(lines, name, metric_type, help_text, samples):
+    # Append one metric family in the Prometheus text exposition format
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}')
+
+
+def render_prometheus():
+    '''Render the persisted runs: cumulative totals of each job and gauges of each job's last run'''
+    lines = []
+    jobs = IngestionRun.objects.order_by('job').values_list('job', flat=True).distinct()
+    last_runs = [IngestionRun.objects.filter(job=job).latest('started_at') for job in jobs]
+    totals = IngestionTotal.objects.order_by('job')
+
+    for counter in ['fetched', 'skipped', 'written']:
+        prometheus_metric(
+            lines, f'quickcheck_ingestion_items_{counter}_total', 'counter', f'Items {counter} by all runs',
+            [({'job': total.job}, getattr(total, counter)) for total in totals],
+        )
+    prometheus_metric(lines, 'quickcheck_ingestion_runs_total', 'counter', 'Runs recorded',
+                      [({'job': total.job}, total.runs) for total in totals])
+    prometheus_metric(lines, 'quickcheck_ingestion_failed_runs_total', 'counter', 'Runs stopped by an error',
+                      [({'job': total.job}, total.failed_runs) for total in totals])
+    prometheus_metric(lines, 'quickcheck_ingestion_run_seconds_total', 'counter', 'Time spent in all runs',
+                      [({'job': total.job}, round(total.seconds, 6)) for total in totals])
+
+    # Gauges describing the last run of each job
+    prometheus_metric(lines, 'quickcheck_ingestion_last_run_duration_seconds', 'gauge', 'Duration of the last run',
+                      [({'job': run.job}, round(run.duration, 6)) for run in last_runs])
+    prometheus_metric(lines, 'quickcheck_ingestion_last_run_items_per_second', 'gauge', 'Items fetched per second by the last run',
+                      [({'job': run.job}, run.items_per_second) for run in last_runs])
+    prometheus_metric(lines, 'quickcheck_ingestion_last_run_unchanged_ratio', 'gauge', 'Fraction of the items fetched by the last run that were skipped as unchanged',
+                      [({'job': run.job}, run.unchanged_ratio) for run in last_runs])
+    prometheus_metric(lines, 'quickcheck_ingestion_last_run_max_queue_depth', 'gauge', 'Largest backlog of items waiting to be fetched in the last run',
+                      [({'job': run.job}, run.max_queue_depth) for run in last_runs])
+    prometheus_metric(lines, 'quickcheck_ingestion_last_run_paused', 'gauge', 'Whether the circuit breaker paused the last run',
+                      [({'job': run.job}, int(run.paused)) for run in last_runs])
+    prometheus_metric(lines, 'quickcheck_ingestion_last_run_failed', 'gauge', 'Whether an error stopped the last run',
+                      [({'job': run.job}, int(run.failed)) for run in last_runs])
+    prometheus_metric(lines, 'quickcheck_ingestion_last_run_stage_seconds', 'gauge', 'Time the last run spent waiting on the network, writing to the DB and in Python',
+                      [({'job': run.job, 'stage': stage}, seconds) for run in last_runs for stage, seconds in run.stage_seconds.items()])
+
+    # Response cache counters
+    stats = cache_stats()
+    for outcome in ['hits', 'misses']:
+        prometheus_metric(lines, f'quickcheck_response_cache_{outcome}_total', 'counter', f'Response cache {outcome} by view',
+                          [({'view': view}, counts[outcome]) for view, counts in stats.items()])
+
+    # Fetch latency of the last run of each job
+    lines.append('# HELP quickcheck_ingestion_fetch_latency_seconds Fetch latency of the last run')
+    lines.append('# TYPE quickcheck_ingestion_fetch_latency_seconds histogram')
+    for run in last_runs:
+        histogram = run.fetch_latency
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            lines.append(f'quickcheck_ingestion_fetch_latency_seconds_bucket{{job="{run.job}",le="{bound}"}} {count}')
+        lines.append(f'quickcheck_ingestion_fetch_latency_seconds_bucket{{job="{run.job}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'quickcheck_ingestion_fetch_latency_seconds_sum{{job="{run.job}"}} {histogram["sum"]}')
+        lines.append(f'quickcheck_ingestion_fetch_latency_seconds_count{{job="{run.job}"}} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
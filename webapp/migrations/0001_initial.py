@@ -0,0 +1,39 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:00
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HackerNewsPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('post_id', models.CharField(max_length=500, unique=True)),
+                ('descendants', models.CharField(blank=True, max_length=500, null=True)),
+                ('by', models.CharField(blank=True, max_length=500, null=True)),
+                ('kids', models.TextField(blank=True, max_length=500, null=True)),
+                ('score', models.IntegerField(blank=True, null=True)),
+                ('time', models.CharField(blank=True, max_length=500, null=True)),
+                ('title', models.CharField(blank=True, max_length=500, null=True)),
+                ('text', models.TextField(blank=True, null=True)),
+                ('type', models.CharField(blank=True, max_length=500, null=True)),
+                ('url', models.CharField(blank=True, max_length=500, null=True)),
+                ('source', models.CharField(blank=True, max_length=100, null=True)),
+                ('user_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('parent', models.CharField(blank=True, max_length=500, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Posts',
+            },
+        ),
+    ]
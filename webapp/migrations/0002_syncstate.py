@@ -0,0 +1,28 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:00
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('high_water_mark', models.PositiveBigIntegerField(default=0)),
+                ('changed_ids', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'verbose_name_plural': 'Sync states',
+            },
+        ),
+    ]
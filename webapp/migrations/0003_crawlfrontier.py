@@ -0,0 +1,33 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0002_syncstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlFrontier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.PositiveBigIntegerField(unique=True)),
+                ('depth', models.PositiveSmallIntegerField(default=1)),
+            ],
+            options={
+                'verbose_name_plural': 'Crawl frontier',
+            },
+        ),
+        migrations.AddField(
+            model_name='syncstate',
+            name='checkpoint',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='crawlfrontier',
+            index=models.Index(fields=['depth', 'item_id'], name='webapp_craw_depth_61f4fa_idx'),
+        ),
+    ]
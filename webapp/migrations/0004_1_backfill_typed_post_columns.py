@@ -0,0 +1,80 @@
+from ast import literal_eval
+from datetime import datetime, timezone
+
+from django.db import migrations, transaction
+from django.utils import timezone as django_timezone
+
+
+BATCH_SIZE = 1000
+
+# Legacy string columns and the typed columns they are copied to
+LEGACY_FIELDS = ['post_id', 'descendants', 'kids', 'parent', 'time']
+TYPED_FIELDS = [f'{field}_typed' for field in LEGACY_FIELDS]
+
+# Sync state holding the time the backfill started, so 0004_2 can copy again the rows written since
+CHECKPOINT = 'typed_post_columns'
+
+
+def to_int(value):
+    # Legacy values are numeric strings, empty strings or None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_kids(value):
+    # kids was stored as a Python list repr
+    try:
+        kids = literal_eval(value) if value else None
+    except (ValueError, SyntaxError):
+        return None
+    return kids if isinstance(kids, list) else None
+
+
+def to_time(value):
+    # time was stored as a unix timestamp
+    timestamp = to_int(value)
+    return None if timestamp is None else datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def copy_to_typed_columns(posts):
+    '''Convert the legacy columns of the posts into the typed ones, one short transaction per batch'''
+    last_pk = 0
+    while True:
+        # Each batch commits on its own, so the table is never held for long and readers and writers get in between
+        with transaction.atomic():
+            batch = list(posts.filter(pk__gt=last_pk).order_by('pk').only(*LEGACY_FIELDS)[:BATCH_SIZE])
+            if not batch:
+                return
+            for post in batch:
+                post.post_id_typed = to_int(post.post_id)
+                post.descendants_typed = to_int(post.descendants)
+                post.kids_typed = to_kids(post.kids)
+                post.parent_typed = to_int(post.parent)
+                post.time_typed = to_time(post.time)
+            posts.model.objects.bulk_update(batch, TYPED_FIELDS)
+        last_pk = batch[-1].pk
+
+
+def backfill_typed_columns(apps, schema_editor):
+    HackerNewsPost = apps.get_model('webapp', 'HackerNewsPost')
+    SyncState = apps.get_model('webapp', 'SyncState')
+
+    # Rows written by the running app from now on are copied again when the model switches over
+    SyncState.objects.update_or_create(name=CHECKPOINT, defaults={'checkpoint': django_timezone.now()})
+    copy_to_typed_columns(HackerNewsPost.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    # Not atomic: the backfill commits batch by batch while the app keeps running
+    atomic = False
+
+    dependencies = [
+        ('webapp', '0004_add_typed_post_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_typed_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+from importlib import import_module
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+backfill = import_module('webapp.migrations.0004_1_backfill_typed_post_columns')
+
+
+def copy_rows_written_since_backfill(apps, schema_editor):
+    # The app kept writing the legacy columns during the backfill: copy the rows it wrote again, in the same
+    # transaction as the switch so none can slip in between
+    HackerNewsPost = apps.get_model('webapp', 'HackerNewsPost')
+    SyncState = apps.get_model('webapp', 'SyncState')
+    state = SyncState.objects.filter(name=backfill.CHECKPOINT).first()
+    posts = HackerNewsPost.objects.all()
+    if state and state.checkpoint:
+        posts = posts.filter(modified__gte=state.checkpoint)
+    backfill.copy_to_typed_columns(posts)
+    SyncState.objects.filter(name=backfill.CHECKPOINT).delete()
+
+
+# Switch step: the legacy columns step aside and the typed ones take their names, which only renames columns, then
+# the typed columns get their constraints and indexes. 0004_3 drops the legacy columns
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0004_1_backfill_typed_post_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_rows_written_since_backfill, migrations.RunPython.noop),
+    ] + [
+        migrations.RenameField(model_name='hackernewspost', old_name=field, new_name=f'{field}_legacy')
+        for field in backfill.LEGACY_FIELDS
+    ] + [
+        migrations.RenameField(model_name='hackernewspost', old_name=f'{field}_typed', new_name=field)
+        for field in backfill.LEGACY_FIELDS
+    ] + [
+        migrations.AlterField(
+            model_name='hackernewspost',
+            name='post_id',
+            field=models.PositiveBigIntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='hackernewspost',
+            name='parent',
+            field=models.ForeignKey(blank=True, db_column='parent', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='children', to='webapp.hackernewspost', to_field='post_id'),
+        ),
+        migrations.AlterField(
+            model_name='hackernewspost',
+            name='time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
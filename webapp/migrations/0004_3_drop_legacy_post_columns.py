@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+# Contract step: nothing reads the legacy string columns any more
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0004_2_switch_to_typed_post_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name='hackernewspost', name='post_id_legacy'),
+        migrations.RemoveField(model_name='hackernewspost', name='descendants_legacy'),
+        migrations.RemoveField(model_name='hackernewspost', name='kids_legacy'),
+        migrations.RemoveField(model_name='hackernewspost', name='parent_legacy'),
+        migrations.RemoveField(model_name='hackernewspost', name='time_legacy'),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+# Expand step of moving the legacy string columns of posts to typed ones: add the typed columns next to them, empty
+# and nullable, so adding them doesn't rewrite the table. 0004_1 fills them in batches, 0004_2 switches the model
+# over to them and 0004_3 drops the string columns
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0003_crawlfrontier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='post_id_typed',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='descendants_typed',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='kids_typed',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='parent_typed',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='time_typed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0004_3_drop_legacy_post_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
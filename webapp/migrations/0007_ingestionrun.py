@@ -0,0 +1,33 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0006_leaderlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField()),
+                ('duration', models.FloatField()),
+                ('fetched', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('written', models.PositiveIntegerField(default=0)),
+                ('paused', models.BooleanField(default=False)),
+                ('max_queue_depth', models.PositiveIntegerField(default=0)),
+                ('stage_seconds', models.JSONField(default=dict)),
+                ('fetch_latency', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ingestionrun',
+            index=models.Index(fields=['job', 'started_at'], name='webapp_inge_job_e547b1_idx'),
+        ),
+    ]
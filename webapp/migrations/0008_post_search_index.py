@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+# External content FTS5 index over the searchable columns of the posts table; the triggers keep it in sync
+CREATE_INDEX = [
+    '''
+    CREATE VIRTUAL TABLE webapp_hackernewspost_fts USING fts5(
+        title, text, "by",
+        content='webapp_hackernewspost', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    ''',
+    '''
+    CREATE TRIGGER webapp_hackernewspost_fts_insert AFTER INSERT ON webapp_hackernewspost BEGIN
+        INSERT INTO webapp_hackernewspost_fts(rowid, title, text, "by") VALUES (new.id, new.title, new.text, new."by");
+    END
+    ''',
+    '''
+    CREATE TRIGGER webapp_hackernewspost_fts_delete AFTER DELETE ON webapp_hackernewspost BEGIN
+        INSERT INTO webapp_hackernewspost_fts(webapp_hackernewspost_fts, rowid, title, text, "by")
+        VALUES ('delete', old.id, old.title, old.text, old."by");
+    END
+    ''',
+    '''
+    CREATE TRIGGER webapp_hackernewspost_fts_update AFTER UPDATE OF title, text, "by" ON webapp_hackernewspost BEGIN
+        INSERT INTO webapp_hackernewspost_fts(webapp_hackernewspost_fts, rowid, title, text, "by")
+        VALUES ('delete', old.id, old.title, old.text, old."by");
+        INSERT INTO webapp_hackernewspost_fts(rowid, title, text, "by") VALUES (new.id, new.title, new.text, new."by");
+    END
+    ''',
+    # Index the rows that already exist
+    "INSERT INTO webapp_hackernewspost_fts(webapp_hackernewspost_fts) VALUES ('rebuild')",
+]
+
+DROP_INDEX = [
+    'DROP TRIGGER IF EXISTS webapp_hackernewspost_fts_insert',
+    'DROP TRIGGER IF EXISTS webapp_hackernewspost_fts_delete',
+    'DROP TRIGGER IF EXISTS webapp_hackernewspost_fts_update',
+    'DROP TABLE IF EXISTS webapp_hackernewspost_fts',
+]
+
+
+def run_on_sqlite(statements):
+    # FTS5 is SQLite only; other databases fall back to substring search in webapp.search
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0007_ingestionrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_INDEX), run_on_sqlite(DROP_INDEX)),
+    ]
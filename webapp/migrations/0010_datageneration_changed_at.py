@@ -0,0 +1,19 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0009_datageneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datageneration',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0010_datageneration_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hackernewspost',
+            index=models.Index(fields=['parent', 'time'], name='webapp_hack_parent_1c2ec6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hackernewspost',
+            index=models.Index(fields=['parent', 'type', 'time'], name='webapp_hack_parent_532ba6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hackernewspost',
+            index=models.Index(fields=['type', 'time'], name='webapp_hack_type_aaadc1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hackernewspost',
+            index=models.Index(fields=['source', 'modified'], name='webapp_hack_source_13a9cf_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0011_post_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='hot_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='hackernewspost',
+            index=models.Index(fields=['parent', 'hot_score'], name='webapp_hack_parent_7a0b7e_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0012_post_hot_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500, unique=True)),
+                ('submissions', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('score', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlyTypeCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(blank=True, max_length=500)),
+                ('hour', models.DateTimeField()),
+                ('posts', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoryCommentCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('story_id', models.PositiveBigIntegerField(unique=True)),
+                ('comments', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='story_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='storycommentcount',
+            index=models.Index(fields=['comments'], name='webapp_stor_comment_4c5ee9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hourlytypecount',
+            index=models.Index(fields=['hour'], name='webapp_hour_hour_ec42e4_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlytypecount',
+            constraint=models.UniqueConstraint(fields=('type', 'hour'), name='unique_type_hour'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['score'], name='webapp_auth_score_aa26b3_idx'),
+        ),
+    ]
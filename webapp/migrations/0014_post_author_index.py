@@ -0,0 +1,17 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0013_stats_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hackernewspost',
+            index=models.Index(fields=['by', 'time'], name='webapp_hack_by_789dc3_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The single-column index Django created for the parent foreign key; the (parent, time) index covers its lookups
+PARENT_INDEX = 'webapp_hackernewspost_parent_61549d1d'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0014_post_author_index'),
+    ]
+
+    operations = [
+        # On SQLite, AlterField would rebuild the posts table and lose the search index triggers of 0008;
+        # dropping the index is all the database needs
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    f'DROP INDEX IF EXISTS "{PARENT_INDEX}"',
+                    f'CREATE INDEX "{PARENT_INDEX}" ON "webapp_hackernewspost" ("parent")',
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='hackernewspost',
+                    name='parent',
+                    field=models.ForeignKey(blank=True, db_column='parent', db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='children', to='webapp.hackernewspost', to_field='post_id'),
+                ),
+            ],
+        ),
+    ]
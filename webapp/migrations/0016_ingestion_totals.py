@@ -0,0 +1,47 @@
+# Generated by Django 4.1.9 on 2026-10-18 20:55
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_totals(apps, schema_editor):
+    # Start the cumulative counters from the runs still retained; earlier runs were already pruned
+    IngestionRun = apps.get_model('webapp', 'IngestionRun')
+    IngestionTotal = apps.get_model('webapp', 'IngestionTotal')
+    rows = IngestionRun.objects.values('job').annotate(Count('id'), Sum('fetched'), Sum('skipped'), Sum('written'), Sum('duration'))
+    IngestionTotal.objects.bulk_create(
+        IngestionTotal(
+            job=row['job'], runs=row['id__count'], fetched=row['fetched__sum'], skipped=row['skipped__sum'],
+            written=row['written__sum'], seconds=row['duration__sum'],
+        )
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0015_drop_post_parent_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100, unique=True)),
+                ('runs', models.PositiveBigIntegerField(default=0)),
+                ('failed_runs', models.PositiveBigIntegerField(default=0)),
+                ('fetched', models.PositiveBigIntegerField(default=0)),
+                ('skipped', models.PositiveBigIntegerField(default=0)),
+                ('written', models.PositiveBigIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingestionrun',
+            name='failed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(seed_totals, migrations.RunPython.noop),
+    ]
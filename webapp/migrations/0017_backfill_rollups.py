@@ -0,0 +1,70 @@
+from datetime import timezone
+
+from django.db import migrations
+from django.db.models import Case, Count, Exists, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, TruncHour
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_rollups(apps, schema_editor):
+    # 0013 created the rollup tables empty: build them, and the thread of every stored comment, from the existing
+    # posts so the incremental updates start from the right counts. Written against the models as of this migration
+    HackerNewsPost = apps.get_model('webapp', 'HackerNewsPost')
+    HourlyTypeCount = apps.get_model('webapp', 'HourlyTypeCount')
+    StoryCommentCount = apps.get_model('webapp', 'StoryCommentCount')
+    Author = apps.get_model('webapp', 'Author')
+    posts = HackerNewsPost.objects.all()
+
+    # Set the story of each comment, one thread level per query, from parents that know theirs
+    parents = posts.filter(post_id=OuterRef('parent_id'))
+    resolved = parents.filter(Q(parent__isnull=True) | Q(story_id__isnull=False))
+    story = resolved.annotate(story=Case(When(parent__isnull=True, then='post_id'), default='story_id')).values('story')[:1]
+    while posts.filter(parent__isnull=False, story_id__isnull=True).filter(Exists(resolved)).update(story_id=Subquery(story)):
+        pass
+
+    hourly = {}
+    rows = (
+        posts.filter(time__isnull=False).annotate(hour=TruncHour('time', tzinfo=timezone.utc))
+        .values_list('type', 'hour').annotate(posts=Count('id')).order_by()
+    )
+    for post_type, hour, count in rows:
+        hourly[post_type or '', hour] = hourly.get((post_type or '', hour), 0) + count
+    stories = (
+        posts.filter(parent__isnull=False, story_id__isnull=False)
+        .values_list('story_id').annotate(comments=Count('id')).order_by()
+    )
+    authors = (
+        posts.exclude(by__isnull=True).exclude(by='').values_list('by').annotate(
+            submissions=Count('id', filter=Q(parent__isnull=True)),
+            comments=Count('id', filter=Q(parent__isnull=False)),
+            score=Coalesce(Sum('score', filter=Q(parent__isnull=True)), 0),
+        ).order_by()
+    )
+
+    # Replace whatever the incremental updates wrote before this migration ran
+    for model in [HourlyTypeCount, StoryCommentCount, Author]:
+        model.objects.all().delete()
+    HourlyTypeCount.objects.bulk_create(
+        [HourlyTypeCount(type=post_type, hour=hour, posts=count) for (post_type, hour), count in hourly.items()],
+        batch_size=BATCH_SIZE,
+    )
+    StoryCommentCount.objects.bulk_create(
+        [StoryCommentCount(story_id=story_id, comments=count) for story_id, count in stories], batch_size=BATCH_SIZE,
+    )
+    Author.objects.bulk_create(
+        [Author(name=name, submissions=submissions, comments=comments, score=score) for name, submissions, comments, score in authors],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0016_ingestion_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.9 on 2026-10-18 21:10
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def backfill_depths(apps, schema_editor):
+    # Replies to top-level posts first, then one thread level further per query, until no comment gains a depth
+    HackerNewsPost = apps.get_model('webapp', 'HackerNewsPost')
+    parents = HackerNewsPost.objects.filter(post_id=OuterRef('parent_id'))
+    unknown = HackerNewsPost.objects.filter(parent__isnull=False, depth__isnull=True)
+
+    updated = unknown.filter(Exists(parents.filter(parent__isnull=True))).update(depth=1)
+    depth = 1
+    while updated:
+        updated = unknown.filter(Exists(parents.filter(depth=depth))).update(depth=depth + 1)
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0017_backfill_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hackernewspost',
+            name='depth',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_depths, migrations.RunPython.noop),
+    ]
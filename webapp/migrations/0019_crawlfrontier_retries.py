@@ -0,0 +1,23 @@
+# Generated by Django 4.1.9 on 2026-10-18 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webapp', '0018_post_depth'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlfrontier',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='crawlfrontier',
+            name='retry_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
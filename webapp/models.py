@@ -1,29 +1,178 @@
 from django.db import models
+from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 
 
 TYPES = ["job", "story","poll", "pollopt"]
 
 class HackerNewsPost(TimeStampedModel, models.Model):
-    post_id = models.CharField(max_length=500, unique=True)
-    descendants = models.CharField(max_length=500, blank=True, null=True)
+    post_id = models.PositiveBigIntegerField(unique=True)
+    descendants = models.PositiveIntegerField(blank=True, null=True)
     by = models.CharField(max_length=500, blank=True, null=True)
-    kids = models.TextField(max_length=500, blank=True, null=True)
+    kids = models.JSONField(blank=True, null=True) # Ids of the direct kids, in Hacker News ranking order
     score = models.IntegerField(blank=True, null=True)
-    time = models.CharField(max_length=500, blank=True, null=True)
+    time = models.DateTimeField(blank=True, null=True, db_index=True)
     title = models.CharField(max_length=500, blank=True, null=True)
     text = models.TextField(blank=True, null=True)
     type = models.CharField(max_length=500, blank=True, null=True)
     url = models.CharField(max_length=500, blank=True, null=True)
     source = models.CharField(max_length=100, blank=True, null=True)
     user_id = models.PositiveIntegerField(blank=True, null=True)
-    parent = models.CharField(max_length=500, blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True) # Fingerprint of the fields written by the last sync
+    hot_score = models.FloatField(blank=True, null=True) # Front page ranking of recent top-level posts, see webapp.ranking
+    story_id = models.PositiveBigIntegerField(blank=True, null=True) # post_id of the top-level post a comment's thread belongs to
+    depth = models.PositiveSmallIntegerField(blank=True, null=True) # Levels a comment lies below its thread's top-level post
+
+    # Comments reference their parent by post_id; no database constraint because kids can be stored before their parent
+    parent = models.ForeignKey(
+        'self', to_field='post_id', db_column='parent', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='children', blank=True, null=True,
+        db_index=False, # Covered by the (parent, time) index
+    )
 
     class Meta:
         verbose_name_plural = 'Posts'
+        indexes = [
+            models.Index(fields=['parent', 'time']), # Top-level posts newest first (API list) and comment thread levels
+            models.Index(fields=['parent', 'type', 'time']), # Top-level posts of some types, newest first
+            models.Index(fields=['type', 'time']), # Homepage filtered by type
+            models.Index(fields=['source', 'modified']), # Posts a sync job or an export changed since a checkpoint
+            models.Index(fields=['parent', 'hot_score']), # Top-level posts by rank
+            models.Index(fields=['by', 'time']), # An author's posts and comments newest first
+        ]
+
+    def __str__(self) -> str:
+        return self.title or str(self.post_id)
+
+
+class SyncState(TimeStampedModel, models.Model):
+    '''Persisted progress of a sync job between runs'''
+    name = models.CharField(max_length=100, unique=True)
+    high_water_mark = models.PositiveBigIntegerField(default=0) # Highest item id seen upstream on the last run
+    changed_ids = models.JSONField(default=list, blank=True) # Stored items changed upstream but not refetched yet
+    checkpoint = models.DateTimeField(blank=True, null=True) # Point in time the job has fully processed up to
+
+    class Meta:
+        verbose_name_plural = 'Sync states'
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class CrawlFrontier(models.Model):
+    '''Comment ids waiting to be fetched by the comment tree crawler'''
+    item_id = models.PositiveBigIntegerField(unique=True)
+    depth = models.PositiveSmallIntegerField(default=1) # Levels below the item whose kids seeded the crawl
+    attempts = models.PositiveSmallIntegerField(default=0) # Failed fetches so far
+    retry_after = models.DateTimeField(blank=True, null=True) # Not fetched again before this time after a failure
+
+    class Meta:
+        verbose_name_plural = 'Crawl frontier'
+        indexes = [models.Index(fields=['depth', 'item_id'])]
+
+    def __str__(self) -> str:
+        return str(self.item_id)
+
+
+class LeaderLease(models.Model):
+    '''Time-limited lease that elects a single process to run the ingestion scheduler'''
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=255) # Identifier of the process owning the lease
+    expires_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.holder})'
+
+
+class IngestionRun(models.Model):
+    '''Metrics recorded for one run of a sync job'''
+    job = models.CharField(max_length=100)
+    started_at = models.DateTimeField()
+    duration = models.FloatField() # Seconds
+    fetched = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0) # Items not fetched because nothing changed upstream
+    written = models.PositiveIntegerField(default=0)
+    paused = models.BooleanField(default=False) # Stopped early by the circuit breaker
+    failed = models.BooleanField(default=False) # Stopped by an error
+    max_queue_depth = models.PositiveIntegerField(default=0)
+    stage_seconds = models.JSONField(default=dict) # Time spent waiting on the network, writing to the DB and in Python
+    fetch_latency = models.JSONField(default=dict) # Histogram of request latencies
+
+    class Meta:
+        indexes = [models.Index(fields=['job', 'started_at'])]
+
+    def __str__(self) -> str:
+        return f'{self.job} at {self.started_at}'
+
+    @property
+    def items_per_second(self):
+        return round(self.fetched / self.duration, 3) if self.duration else 0
+
+    @property
+    def unchanged_ratio(self):
+        # Fetched items that were not written because their content hash matched
+        return round((self.fetched - self.written) / self.fetched, 3) if self.fetched else 0
+
+
+class IngestionTotal(models.Model):
+    '''Cumulative counters of a sync job, added to by every run and never decreased when runs are pruned'''
+    job = models.CharField(max_length=100, unique=True)
+    runs = models.PositiveBigIntegerField(default=0)
+    failed_runs = models.PositiveBigIntegerField(default=0)
+    fetched = models.PositiveBigIntegerField(default=0)
+    skipped = models.PositiveBigIntegerField(default=0)
+    written = models.PositiveBigIntegerField(default=0)
+    seconds = models.FloatField(default=0) # Time spent in the runs
+
+    def __str__(self) -> str:
+        return self.job
+
+
+class DataGeneration(models.Model):
+    '''Version of the post data, bumped by every write so responses cached for older versions are never served'''
+    name = models.CharField(max_length=100, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now) # Time of the last bump, served as Last-Modified
+
+    def __str__(self) -> str:
+        return f'{self.name} {self.value}'
+
+
+class HourlyTypeCount(models.Model):
+    '''Rollup of the number of posts of each type created in each hour'''
+    type = models.CharField(max_length=500, blank=True) # Empty for posts without a type
+    hour = models.DateTimeField() # Start of the hour, in UTC
+    posts = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['type', 'hour'], name='unique_type_hour')]
+        indexes = [models.Index(fields=['hour'])]
+
+    def __str__(self) -> str:
+        return f'{self.type} at {self.hour}'
+
+
+class StoryCommentCount(models.Model):
+    '''Rollup of the number of stored comments in each top-level post's thread'''
+    story_id = models.PositiveBigIntegerField(unique=True)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['comments'])]
 
     def __str__(self) -> str:
-        return self.title
+        return str(self.story_id)
 
 
+class Author(models.Model):
+    '''Rollup of each author's submissions, comments and the total score of their submissions, served with their feed'''
+    name = models.CharField(max_length=500, unique=True)
+    submissions = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    score = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [models.Index(fields=['score'])]
+
+    def __str__(self) -> str:
+        return self.name
@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from webapp.cache import current_generation
+
+
+def encode_position(post, reverse=False):
+    '''Opaque cursor pointing at a post's (time, id), and the direction to page in from it'''
+    # Pages are lists of posts or of .values() rows
+    time, post_id = (post['time'], post['id']) if isinstance(post, dict) else (post.time, post.id)
+    position = {'t': time.isoformat(), 'i': post_id, 'r': reverse}
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode()
+
+
+def decode_position(token):
+    '''Return the (time, id, reverse) of a cursor; raises ValueError if it was tampered with'''
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return datetime.fromisoformat(position['t']), int(position['i']), bool(position['r'])
+    except (TypeError, ValueError, KeyError, AttributeError):
+        raise ValueError('Invalid cursor')
+
+
+def older_than(queryset, time, post_id):
+    # Posts after the position in newest first order. The redundant time bound lets the database seek to
+    # the position on a time index; the OR alone is not a range condition, so every newer row would be walked
+    return queryset.filter(Q(time__lt=time) | Q(time=time, id__lt=post_id), time__lte=time).order_by('-time', '-id')
+
+
+def newer_than(queryset, time, post_id):
+    # Posts before the position, nearest first, seeking to it like older_than
+    return queryset.filter(Q(time__gt=time) | Q(time=time, id__gt=post_id), time__gte=time).order_by('time', 'id')
+
+
+class CappedPaginator(Paginator):
+    '''
+    Paginator numbering at most `max_pages` pages: the count stops at the cap and is cached per data
+    generation, so neither counting nor the OFFSET of the last page grows with the table
+    '''
+
+    def __init__(self, *args, max_pages=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_pages = max_pages or settings.HOME_MAX_PAGES
+
+    @cached_property
+    def limit(self):
+        return self.max_pages * self.per_page
+
+    @cached_property
+    def bounded_count(self):
+        # Count one row past the cap to know whether older posts lie beyond the numbered pages
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            # A queryset that can't match anything, e.g. none(), has no SQL to key the count by
+            return 0
+        digest = hashlib.sha1(f'{sql}{params}{self.limit}'.encode()).hexdigest()
+        key = f'page-count:{current_generation()}:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list[:self.limit + 1].count()
+            cache.set(key, count)
+        return count
+
+    @cached_property
+    def count(self):
+        return min(self.bounded_count, self.limit)
+
+    @cached_property
+    def truncated(self):
+        # More posts exist than the numbered pages show
+        return self.bounded_count > self.limit
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from webapp.models import HackerNewsPost
+from webapp.utils import chunked
+
+
+def hot_score(score, time, now=None):
+    '''Hacker News style gravity ranking: points decay with the post's age in hours'''
+    if time is None:
+        return None
+    now = now or timezone.now()
+    age_hours = max((now - time).total_seconds() / 3600, 0)
+    # The submitter's own vote doesn't count
+    return max((score or 1) - 1, 0) / (age_hours + 2) ** settings.HN_HOT_GRAVITY
+
+
+def is_ranked(post, now=None):
+    # Only recent top-level submissions compete for the front page
+    now = now or timezone.now()
+    return (
+        post.parent_id is None and post.type != 'comment' and post.time is not None
+        and post.time >= now - timedelta(days=settings.HN_HOT_WINDOW_DAYS)
+    )
+
+
+def rank(post, now=None):
+    '''Set the post's hot_score, or clear it if the post doesn't compete for the front page'''
+    post.hot_score = hot_score(post.score, post.time, now) if is_ranked(post, now) else None
+    return post
+
+
+def refresh_hot_scores(batch_size=None):
+    '''Recompute the hot score of every post in the ranking window as it ages, and drop the posts that left it'''
+    print('refresh hot scores started', datetime.now())
+    batch_size = batch_size or settings.HN_UPSERT_BATCH_SIZE
+    now = timezone.now()
+    cutoff = now - timedelta(days=settings.HN_HOT_WINDOW_DAYS)
+
+    # Posts older than the window leave the ranking
+    dropped = HackerNewsPost.objects.filter(hot_score__isnull=False, time__lt=cutoff).update(hot_score=None)
+
+    # Recompute the rest in batches, reading only the columns the score depends on
+    posts = (
+        HackerNewsPost.objects.filter(parent__isnull=True, time__gte=cutoff).exclude(type='comment')
+        .only('id', 'score', 'time', 'parent', 'type')
+    )
+    ranked = 0
+    for batch in chunked(posts.iterator(chunk_size=batch_size), batch_size):
+        for post in batch:
+            post.hot_score = hot_score(post.score, post.time, now)
+        HackerNewsPost.objects.bulk_update(batch, ['hot_score'])
+        ranked += len(batch)
+
+    stats = {'ranked': ranked, 'dropped': dropped}
+    print('refresh hot scores finished', datetime.now(), stats)
+    return stats
@@ -0,0 +1,134 @@
+import operator
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import reduce
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncHour
+
+from webapp.models import Author, HackerNewsPost, HourlyTypeCount, StoryCommentCount
+from webapp.threads import backfill_story_ids
+from webapp.utils import chunked
+
+# Post columns the rollups are computed from
+ROLLUP_FIELDS = ['post_id', 'type', 'time', 'by', 'score', 'parent_id', 'story_id']
+
+# Key and counter columns of each rollup table
+ROLLUP_KEYS = {HourlyTypeCount: ['type', 'hour'], StoryCommentCount: ['story_id'], Author: ['name']}
+ROLLUP_COUNTERS = {HourlyTypeCount: ['posts'], StoryCommentCount: ['comments'], Author: ['submissions', 'comments', 'score']}
+
+
+def post_values(post):
+    # The rollup columns of a post instance
+    return {field: getattr(post, field) for field in ROLLUP_FIELDS}
+
+
+def hour_of(time):
+    # Start of the UTC hour a post was created in
+    return time.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def contributions(post):
+    '''What a post adds to the rollups, as a Counter keyed by (model, key, counter)'''
+    counts = Counter()
+    is_comment = post['parent_id'] is not None
+    if post['time'] is not None:
+        counts[HourlyTypeCount, (post['type'] or '', hour_of(post['time'])), 'posts'] += 1
+    if is_comment and post['story_id'] is not None:
+        counts[StoryCommentCount, (post['story_id'],), 'comments'] += 1
+    if post['by']:
+        counts[Author, (post['by'],), 'comments' if is_comment else 'submissions'] += 1
+        if not is_comment:
+            counts[Author, (post['by'],), 'score'] += post['score'] or 0
+    return counts
+
+
+def apply_deltas(deltas):
+    '''
+    Add the deltas to the rollup rows in the database, so concurrent writers never overwrite
+    each other's counts: one insert per rollup table, then one update per distinct set of amounts
+    '''
+    changes = defaultdict(lambda: defaultdict(Counter))
+    for (model, key, counter), amount in deltas.items():
+        if amount:
+            changes[model][key][counter] += amount
+
+    for model, rows in changes.items():
+        keys, counters = ROLLUP_KEYS[model], ROLLUP_COUNTERS[model]
+
+        # Make sure every row exists; rows already there, or created meanwhile by another writer, are left alone
+        model.objects.bulk_create([model(**dict(zip(keys, key))) for key in rows], ignore_conflicts=True)
+
+        # Rows moved by the same amounts are incremented together, most often every row of the batch
+        groups = defaultdict(list)
+        for key, amounts in rows.items():
+            groups[tuple(amounts[counter] for counter in counters)].append(key)
+        for amounts, group in groups.items():
+            increments = {counter: F(counter) + amount for counter, amount in zip(counters, amounts) if amount}
+            for chunk in chunked(group, settings.HN_UPSERT_BATCH_SIZE):
+                model.objects.filter(rows_matching(keys, chunk)).update(**increments)
+
+
+def rows_matching(keys, values):
+    # Condition matching the rows with exactly one of the given key values
+    if len(keys) == 1:
+        return Q(**{f'{keys[0]}__in': [value for value, in values]})
+    return reduce(operator.or_, (Q(**dict(zip(keys, value))) for value in values))
+
+
+def record_changes(old_rows=(), new_rows=()):
+    '''
+    Move the rollups by the difference between the old and new versions of the
+    written posts: no old row for a created post, no new row for a deleted one
+    '''
+    deltas = Counter()
+    for row in new_rows:
+        deltas.update(contributions(row))
+    for row in old_rows:
+        deltas.subtract(contributions(row))
+    apply_deltas(deltas)
+
+
+def reconcile_rollups(batch_size=None):
+    '''Rebuild every rollup from the posts table, correcting any drift of the incremental updates'''
+    print('reconcile rollups started', datetime.now())
+    batch_size = batch_size or settings.HN_UPSERT_BATCH_SIZE
+    posts = HackerNewsPost.objects.all()
+
+    with transaction.atomic():
+        # Comments stored before their parent are only counted once their thread is known
+        assigned = backfill_story_ids()
+
+        hourly = Counter()
+        rows = (
+            posts.filter(time__isnull=False).annotate(hour=TruncHour('time', tzinfo=dt_timezone.utc))
+            .values_list('type', 'hour').annotate(posts=Count('id')).order_by()
+        )
+        for post_type, hour, count in rows:
+            hourly[post_type or '', hour] += count
+
+        stories = (
+            posts.filter(parent__isnull=False, story_id__isnull=False)
+            .values_list('story_id').annotate(comments=Count('id')).order_by()
+        )
+        authors = (
+            posts.exclude(by__isnull=True).exclude(by='').values_list('by').annotate(
+                submissions=Count('id', filter=Q(parent__isnull=True)),
+                comments=Count('id', filter=Q(parent__isnull=False)),
+                score=Coalesce(Sum('score', filter=Q(parent__isnull=True)), 0),
+            ).order_by()
+        )
+        rebuilt = {
+            HourlyTypeCount: [HourlyTypeCount(type=post_type, hour=hour, posts=count) for (post_type, hour), count in hourly.items()],
+            StoryCommentCount: [StoryCommentCount(story_id=story_id, comments=count) for story_id, count in stories],
+            Author: [Author(name=name, submissions=submissions, comments=comments, score=score) for name, submissions, comments, score in authors],
+        }
+        for model, objects in rebuilt.items():
+            model.objects.all().delete()
+            model.objects.bulk_create(objects, batch_size=batch_size)
+
+    stats = {'story_ids': assigned, 'hours': len(hourly), 'stories': len(rebuilt[StoryCommentCount]), 'authors': len(rebuilt[Author])}
+    print('reconcile rollups finished', datetime.now(), stats)
+    return stats
@@ -0,0 +1,49 @@
+import re
+
+from django.db import connection
+from django.db.models import Q, Value
+
+# FTS5 index created by migration 0008, kept in sync with the posts table by triggers
+FTS_TABLE = 'webapp_hackernewspost_fts'
+
+# Marks around the matched terms in snippets; control characters can't clash with post content
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+WORD = re.compile(r'\w+')
+
+
+def match_query(text):
+    '''Turn free text into an FTS5 query matching every word, as a prefix'''
+    # Quoting each word keeps FTS5 syntax (AND, NEAR, "*", ...) in user input from being interpreted
+    return ' '.join(f'"{word}"*' for word in WORD.findall(text))
+
+
+def search_posts(queryset, text):
+    '''
+    Filter the queryset to the posts matching `text` in their title, text or author,
+    annotated with `search_rank` (lower is more relevant) and a highlighted `search_snippet`
+    '''
+    query = match_query(text)
+    if not query:
+        # Nothing to match, e.g. only punctuation; still annotated so callers can order by relevance
+        return queryset.none().annotate(search_rank=Value(0.0), search_snippet=Value(''))
+
+    if connection.vendor != 'sqlite':
+        # No full-text index: fall back to substring matching, unranked
+        return queryset.filter(Q(title__icontains=text) | Q(text__icontains=text) | Q(by__icontains=text)).annotate(
+            search_rank=Value(0.0), search_snippet=Value(''),
+        )
+
+    # Join the index on rowid so FTS5 drives the query and only matching rows are read
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = webapp_hackernewspost.id', f'{FTS_TABLE} MATCH %s'],
+        params=[query],
+        select={
+            # Title matches weigh more than body and author matches
+            'search_rank': f'bm25({FTS_TABLE}, 5.0, 1.0, 2.0)',
+            'search_snippet': f"snippet({FTS_TABLE}, -1, %s, %s, '…', 16)",
+        },
+        select_params=[HIGHLIGHT_START, HIGHLIGHT_END],
+    )
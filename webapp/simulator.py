@@ -0,0 +1,154 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class HackerNewsCorpus:
+    '''Items served by the simulator: a synthetic comment forest or one recorded from the live API'''
+
+    def __init__(self, items, top_stories, updates=()):
+        self.items = {int(item_id): item for item_id, item in items.items()}
+        self.top_stories = list(top_stories)
+        self.updates = list(updates)
+
+    @classmethod
+    def synthetic(cls, stories=100, branching=3, depth=2, changed=0.1, seed=0):
+        # Build `stories` stories, each with `branching` kids per item down to `depth` comment levels
+        rng = random.Random(seed)
+        now = int(time.time())
+        items = {}
+        next_id = 1
+        for _ in range(stories):
+            story_id = next_id
+            next_id += 1
+            items[story_id] = {
+                "id": story_id, "type": "story", "by": f"user{rng.randrange(1000)}",
+                "title": f"Story {story_id}", "url": f"https://example.com/{story_id}",
+                "score": rng.randrange(1, 500), "time": now - rng.randrange(86400), "kids": [],
+            }
+            level = [story_id]
+            for _ in range(depth):
+                next_level = []
+                for parent_id in level:
+                    for _ in range(branching):
+                        items[next_id] = {
+                            "id": next_id, "type": "comment", "by": f"user{rng.randrange(1000)}",
+                            "parent": parent_id, "text": f"Comment {next_id}", "time": now - rng.randrange(86400), "kids": [],
+                        }
+                        items[parent_id]["kids"].append(next_id)
+                        next_level.append(next_id)
+                        next_id += 1
+                level = next_level
+            items[story_id]["descendants"] = next_id - story_id - 1
+
+        story_ids = [item_id for item_id, item in items.items() if item["type"] == "story"]
+        updates = rng.sample(story_ids, int(len(story_ids) * changed))
+        return cls(items, sorted(story_ids, reverse=True), updates)
+
+    @classmethod
+    def record(cls, client, stories=30, depth=2):
+        # Capture the current top stories and their comment trees from the live API
+        top_stories = client.top_stories()[:stories]
+        items = {}
+        level, current_depth = list(top_stories), 0
+        while level and current_depth <= depth:
+            fetched = list(client.fetch_items(level))
+            items.update((item["id"], item) for item in fetched)
+            level = [kid for item in fetched for kid in item.get("kids") or []]
+            current_depth += 1
+        return cls(items, top_stories, client.updates().get("items", []))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as corpus_file:
+            data = json.load(corpus_file)
+        return cls(data["items"], data["topstories"], data.get("updates", []))
+
+    def dump(self, path):
+        with open(path, "w") as corpus_file:
+            json.dump({"items": self.items, "topstories": self.top_stories, "updates": self.updates}, corpus_file)
+
+
+class HackerNewsSimulator:
+    '''Local HTTP server mimicking the Hacker News Firebase API, with configurable latency and errors'''
+
+    ITEM_PATH = re.compile(r'^/v0/item/(\d+)\.json$')
+
+    def __init__(self, corpus, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v0'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path):
+        # Return the (status, payload) pair for a request path
+        self.requests += 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return 503, {"error": "simulated failure"}
+
+        if path == '/v0/topstories.json':
+            return 200, self.corpus.top_stories
+        if path == '/v0/maxitem.json':
+            return 200, max(self.corpus.items, default=0)
+        if path == '/v0/updates.json':
+            return 200, {"items": self.corpus.updates, "profiles": []}
+        match = self.ITEM_PATH.match(path)
+        if match:
+            # Like Firebase, unknown items are a 200 with a null body
+            return 200, self.corpus.items.get(int(match.group(1)))
+        return 404, {"error": "not found"}
+
+    def handler_class(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+            disable_nagle_algorithm = True # Headers and body are written separately; don't let them wait on delayed ACKs
+
+            def do_GET(self):
+                status, payload = simulator.respond(self.path.split('?')[0])
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
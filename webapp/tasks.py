@@ -1,123 +1,161 @@
-import json
-import uuid
-import requests
-from ast import literal_eval
 from datetime import datetime, timedelta
+import requests
+from django.conf import settings
 from django_apscheduler.jobstores import DjangoJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from webapp.models import HackerNewsPost
+from webapp.cache import bump_generation
+from webapp.fetcher import CircuitOpenError, HackerNewsClient
+from webapp.crawler import crawl_frontier, due_entries, seed_frontier
+from webapp.ingest import COMMENT_FIELDS, STORY_FIELDS, existing_post_ids, upsert_items
+from webapp.metrics import JobMetrics
+from webapp.models import SyncState
+from webapp.ranking import refresh_hot_scores
+from webapp.rollups import reconcile_rollups
+
+# Ids of the scheduled jobs; any other job left in the job store by older versions is removed
+JOB_IDS = ['make_request', 'get_children', 'refresh_hot_ranking', 'reconcile_stats']
+
+
+def plan_incremental_sync(client, submission_ids, state):
+    # Merge the changes reported upstream with the ones left over from the previous run
+    changed_ids = set(state.changed_ids) | set(client.updates().get('items', []))
+
+    # Look up which of the candidate items are already stored in a single query
+    candidates = set(submission_ids) | changed_ids
+    existing_ids = existing_post_ids(candidates)
+
+    # Fetch submissions that are new to us or newer than the high-water mark
+    to_fetch = [item_id for item_id in submission_ids if item_id not in existing_ids or item_id > state.high_water_mark]
+
+    # Refetch stored items that changed upstream, even if they left the top stories
+    changed_ids &= existing_ids
+    to_fetch += sorted(changed_ids - set(to_fetch))
+
+    # Skipped are the stored items not refetched; changed items that were never stored aren't ours to skip
+    skipped = len(existing_ids - set(to_fetch))
+    return to_fetch, changed_ids, skipped
 
-scheduler = BackgroundScheduler()
-scheduler.add_jobstore(DjangoJobStore(), "default")
 
-def make_request():
+def make_request(mode=None, processes=None):
+    mode = mode or settings.HN_SYNC_MODE
     print('initial request started', datetime.now())
-    # Make the API call and store response
-    url = 'https://hacker-news.firebaseio.com/v0/topstories.json'
-    response = requests.get(url)
-
-    # Process Information 
-    submission_ids = response.json()
-    commits = []
-    for i in range(100):
-        # make a separate api call for each submission
-        url = f"https://hacker-news.firebaseio.com/v0/item/{submission_ids[i]}.json"
-        response = requests.get(url)
-        response_dict = json.loads(response.content)
-        if not response_dict:
-            continue
-        data_to_save = {
-            "post_id": response_dict.get('id'),
-            "by": response_dict.get('by'),
-            "kids": response_dict.get('kids'),
-            "score": response_dict.get('score'),
-            "descendants" : response_dict.get('descendants'),
-            "time": response_dict.get('time'),
-            "title": response_dict.get('title'),
-            "text" : response_dict.get('text'),
-            "type": response_dict.get('type'),
-            "url": response_dict.get('url'),
-            "source": 'Hacker API',
-        }
-        
-        post_id = data_to_save.pop('post_id')
-        post, created = HackerNewsPost.objects.get_or_create(post_id=post_id, defaults=data_to_save)
-        
-        # Check if the post was created or already exists in the database
-        if not created:
-            # If the post already exists, update its attributes with the values from data_to_save
-            for key, value in data_to_save.items():
-                setattr(post, key, value)
-            # Add the modified post to the commits list for bulk update
-            commits.append(post)
-
-    # Update the modified fields of existing posts in bulk
-    HackerNewsPost.objects.bulk_update(commits, ['by', 'kids', 'score', 'time', 'title', 'text', 'type', 'url', 'source'])
-    print('initial request finished', datetime.now())
-
-
-def get_children():
+    metrics = JobMetrics('make_request')
+    with metrics.recording() as stats:
+        state, _ = SyncState.objects.get_or_create(name='make_request')
+        fetched_ids = set()
+        comments = []
+        with HackerNewsClient(processes=processes) as client:
+            try:
+                # Make the API call and keep the latest 100 submissions
+                submission_ids = client.top_stories()[:100]
+                max_item = client.max_item()
+
+                # In incremental mode only new or changed items are fetched; the first run is always a full sync
+                to_fetch, changed_ids, skipped = submission_ids, set(), 0
+                if mode == 'incremental' and state.high_water_mark:
+                    to_fetch, changed_ids, skipped = plan_incremental_sync(client, submission_ids, state)
+            except (CircuitOpenError, requests.RequestException, ValueError) as error:
+                # Nothing to fetch without the listings: record the run, paused if the breaker opened, and leave
+                # the sync state as it was for the next run
+                paused = client.breaker.is_open()
+                stats.update(fetched=0, skipped=0, written=0, paused=paused, failed=not paused)
+                print('initial request stopped', datetime.now(), error)
+                return stats
+
+            def fetched_items():
+                # Fetch the submissions concurrently and remember which ones arrived; changed comments are set
+                # aside to be written with their thread fields
+                for item in client.fetch_items(to_fetch):
+                    fetched_ids.add(item['id'])
+                    if 'parent' in item:
+                        comments.append(item)
+                        continue
+                    yield item
+
+            # Write the submissions in batches as they arrive
+            metrics.observe_queue_depth(len(to_fetch))
+            written = upsert_items(fetched_items(), STORY_FIELDS, metrics=metrics)
+            written += upsert_items(comments, COMMENT_FIELDS, metrics=metrics)
+            metrics.record_client(client)
+
+        # Persist the high-water mark and the changed items that still have to be refetched; items the API no
+        # longer has won't come back on a retry
+        state.high_water_mark = max(max_item, state.high_water_mark)
+        state.changed_ids = sorted(changed_ids - fetched_ids - client.missing_ids)
+        state.save()
+
+        # A paused run leaves the items it could not fetch in changed_ids or unstored, so the next run picks them up
+        stats.update(fetched=len(fetched_ids), skipped=skipped, written=written, paused=client.breaker.is_open())
+        if written:
+            # New data: stop serving responses cached for the previous version
+            bump_generation()
+    print('initial request finished', datetime.now(), stats)
+    return stats
+
+
+def get_children(processes=None):
     print('get children started', datetime.now())
+    metrics = JobMetrics('get_children')
+    with metrics.recording() as stats:
+        state, _ = SyncState.objects.get_or_create(name='get_children')
+
+        # Resume an interrupted crawl from its persisted frontier, otherwise start a new one; entries waiting to be
+        # retried don't hold it up
+        seeded = 0
+        if not due_entries().exists():
+            with metrics.timer('seed'):
+                seeded = seed_frontier(state)
+
+        with HackerNewsClient(processes=processes) as client:
+            # Walk the comment trees breadth first, fetching missing comments concurrently
+            stats.update(crawl_frontier(client, metrics=metrics))
+            metrics.record_client(client)
+
+        stats['seeded'] = seeded
+        if stats['written']:
+            bump_generation()
+    print('get children finished', datetime.now(), stats)
+    return stats
+
+
+def refresh_hot_ranking():
+    # Re-rank the recent posts, then stop serving responses cached with the old ranking
+    stats = refresh_hot_scores()
+    if stats['ranked'] or stats['dropped']:
+        bump_generation()
+    return stats
+
+
+def reconcile_stats():
+    # Rebuild the statistics rollups from the posts, then stop serving stats cached from the drifted ones
+    stats = reconcile_rollups()
+    bump_generation()
+    return stats
+
+
+def create_scheduler(processes=None):
+    '''Build a paused scheduler holding the sync, ranking and statistics jobs; the ingestion worker resumes it while it is the leader'''
+    scheduler = BackgroundScheduler()
+    scheduler.add_jobstore(DjangoJobStore(), "default")
+    scheduler.start(paused=True)
+
+    # Drop jobs persisted under random ids by older versions so they don't run twice
+    for job in scheduler.get_jobs():
+        if job.id not in JOB_IDS:
+            job.remove()
 
-    # Retrieve all posts with Hacker API as their source
-    posts = HackerNewsPost.objects.filter(source='Hacker API').all()
-    posts = posts.exclude(parent__isnull=False)
-
-    # Get a list of existing post IDs from the database
-    existing_post_ids = list(HackerNewsPost.objects.values_list('post_id', flat=True))
-    existing_post_ids = list(map(int, existing_post_ids))
-    commits = []
-    for post in posts:
-        if post.kids:
-            print(post.id)
-
-            # Extract the kids list from the post and remove already existing post IDs
-            kids_list = literal_eval(post.kids)
-            final_list = list(set(kids_list) - set(existing_post_ids))
-            for kid in final_list:
-                print(f'getting comments of post_id {post.id}')
-
-                # Retrieve the details of the kid from the Hacker API
-                url = f"https://hacker-news.firebaseio.com/v0/item/{kid}.json"
-                response = requests.get(url)
-                response_dict = json.loads(response.content)
-                if not response_dict:
-                    print(f'No response of id {kid}')
-                    continue
-                # Extract the necessary data to save for the comment
-                data_to_save = {
-                    "post_id" : response_dict.get('id'),
-                    "by" : response_dict.get('by'),
-                    "text" : response_dict.get('text'),
-                    "type" : response_dict.get('type'),
-                    "time" : response_dict.get('time'),
-                    "parent" : response_dict.get('parent'),
-                    "source": 'Hacker API',
-                }
-                post_id = data_to_save.pop('post_id')
-
-                # Check if the kid comment already exists in the database, otherwise create a new one
-                comment,created = HackerNewsPost.objects.get_or_create(post_id=post_id, defaults=data_to_save)
-                if not created:
-                    # If the kid comment already exists, update its attributes with the values from data_to_save
-                    for key, value in data_to_save.items():
-                        setattr(comment, key, value)
-                    commits.append(comment)
-
-    # Bulk update the modified kid comments in the database
-    HackerNewsPost.objects.bulk_update(commits, ['by', 'kids', 'time', 'text', 'type', 'source'])
-    print('get children finished', datetime.now())
-
-
-def schedule_job():
     time_now = datetime.now()
+    job_kwargs = {'processes': processes}
     # Schedule the job to make the initial request(get latest 100 published news) every 5 minutes
-    scheduler.add_job(make_request, 'interval', minutes=5, id=str(uuid.uuid4()), next_run_time=time_now + timedelta(seconds=5))
+    scheduler.add_job(make_request, 'interval', minutes=5, id='make_request', kwargs=job_kwargs, replace_existing=True, next_run_time=time_now + timedelta(seconds=5))
 
     # Schedule the job to get children (comments) every 33 minutes
-    scheduler.add_job(get_children, 'interval', minutes=33, id=str(uuid.uuid4()), next_run_time=time_now + timedelta(minutes=2))
+    scheduler.add_job(get_children, 'interval', minutes=33, id='get_children', kwargs=job_kwargs, replace_existing=True, next_run_time=time_now + timedelta(minutes=2))
 
-    # Start the scheduler
-    scheduler.start()
+    # Schedule the job to re-rank the recent posts as they age every 10 minutes
+    scheduler.add_job(refresh_hot_ranking, 'interval', minutes=10, id='refresh_hot_ranking', replace_existing=True, next_run_time=time_now + timedelta(minutes=1))
 
+    # Schedule the job to rebuild the statistics rollups the sync jobs and API writes keep up to date every 6 hours
+    scheduler.add_job(reconcile_stats, 'interval', hours=6, id='reconcile_stats', replace_existing=True, next_run_time=time_now + timedelta(minutes=3))
+    return scheduler
@@ -1,13 +1,26 @@
+import html
 from datetime import datetime
 from django import template
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from webapp.search import HIGHLIGHT_END, HIGHLIGHT_START
 
 register = template.Library()
 
 @register.filter
 def convert_time(time_stamp):
     try:
-        dt = datetime.fromtimestamp(int(time_stamp))
+        # Posts store a datetime; plain unix timestamps are still accepted
+        dt = time_stamp if isinstance(time_stamp, datetime) else datetime.fromtimestamp(int(time_stamp))
         time = dt.strftime('%m %b, %Y | %I:%M %p')
         return time
     except:
-        return
\ No newline at end of file
+        return
+
+
+@register.filter
+def highlight(snippet):
+    # Search snippets are cut from post HTML: show them as plain text with the matched terms marked
+    text = escape(html.unescape(strip_tags(snippet or '')))
+    return mark_safe(text.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
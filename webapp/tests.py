@@ -1,3 +1,870 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase
+
+from webapp.cache import current_generation
+from webapp.exports import export_queryset, iter_ndjson
+from webapp import fetcher
+from webapp.fetcher import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, HackerNewsClient
+from webapp.ingest import COMMENT_FIELDS, STORY_FIELDS, upsert_items
+from webapp.leases import acquire_lease, release_lease
+from webapp.models import Author, CrawlFrontier, HackerNewsPost, HourlyTypeCount, IngestionRun, IngestionTotal, StoryCommentCount, SyncState
+from webapp.ranking import hot_score, refresh_hot_scores
+from webapp.pagination import encode_position
+from webapp.rollups import reconcile_rollups
+from webapp.search import HIGHLIGHT_END, HIGHLIGHT_START, search_posts
+from webapp.simulator import HackerNewsCorpus, HackerNewsSimulator
+from webapp.tasks import get_children, make_request
+from webapp.threads import aload_comment_tree, load_comment_tree
+from webapp.utils import Histogram
+
+
+def fake_response(payload, status_code=200):
+    # Build a requests.Response that returns the given JSON payload
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = payload.encode()
+    return response
+
+
+class FakeHackerNewsClient:
+    '''In-memory stand-in for HackerNewsClient used by the sync job tests'''
+    def __init__(self, items, top_stories, updates=()):
+        self.items = items
+        self.top_story_ids = list(top_stories)
+        self.updated_ids = list(updates)
+        self.fetched = []
+        self.breaker = CircuitBreaker()
+        self.latency = Histogram()
+        self.wait_seconds = 0.0
+        self.missing_ids = set()
+
+    def __call__(self, *args, **kwargs):
+        # Allow the fake to replace the class so jobs can instantiate it
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def top_stories(self):
+        return self.top_story_ids
+
+    def max_item(self):
+        return max(self.items)
+
+    def updates(self):
+        return {'items': self.updated_ids, 'profiles': []}
+
+    def fetch_items(self, item_ids):
+        # Like the real client, items the API has no data for are left out and reported as missing
+        for item_id in item_ids:
+            self.fetched.append(item_id)
+            if self.items.get(item_id):
+                yield self.items[item_id]
+            else:
+                self.missing_ids.add(item_id)
+
+
+class HackerNewsClientTestCase(SimpleTestCase):
+    '''
+    Tests for the concurrent Hacker News item fetcher
+    '''
+    def setUp(self):
+        self.client = HackerNewsClient(base_url='https://hn.test/v0', concurrency=4, timeout=2)
+        self.items = {
+            1: '{"id": 1, "type": "story", "title": "First"}',
+            2: 'null',
+            3: '{"id": 3, "type": "story", "title": "Third"}',
+            4: 'not json',
+        }
+
+    def tearDown(self):
+        self.client.close()
+
+    def fake_get(self, url, timeout):
+        # Serve items from the in-memory corpus based on the requested url
+        item_id = int(url.rsplit('/', 1)[-1].split('.')[0])
+        return fake_response(self.items[item_id])
+
+    def test_fetch_items_skips_missing_and_invalid_items(self):
+        # Null and unparsable items are skipped without stopping the stream
+        with mock.patch.object(self.client.session, 'get', side_effect=self.fake_get):
+            items = list(self.client.fetch_items([1, 2, 3, 4]))
+        self.assertEqual(sorted(item['id'] for item in items), [1, 3])
+        # Only the null item is reported missing; the invalid one failed and may be fetched on a retry
+        self.assertEqual(self.client.missing_ids, {2})
+
+    def test_fetch_items_uses_configured_timeout(self):
+        # Every request is made through the shared session with the configured timeout
+        with mock.patch.object(self.client.session, 'get', side_effect=self.fake_get) as get:
+            list(self.client.fetch_items([1, 3]))
+        self.assertEqual(get.call_count, 2)
+        for call in get.call_args_list:
+            self.assertEqual(call.kwargs['timeout'], 2)
+
+    def test_transient_failures_are_retried(self):
+        # The first two attempts fail, the third one succeeds
+        responses = [requests.ConnectionError('reset'), fake_response('oops', 503), fake_response(self.items[1])]
+        with self.settings(HN_FETCH_BACKOFF=0.001):
+            client = HackerNewsClient(base_url='https://hn.test/v0')
+        with mock.patch.object(client.session, 'get', side_effect=responses):
+            self.assertEqual(client.item(1)['id'], 1)
+        self.assertEqual(client.breaker.failures, 0)
+
+    def test_circuit_breaker_pauses_the_fetch(self):
+        with self.settings(HN_FETCH_RETRIES=0, HN_CIRCUIT_THRESHOLD=3):
+            client = HackerNewsClient(base_url='https://hn.test/v0', concurrency=1)
+        with mock.patch.object(client.session, 'get', side_effect=requests.ConnectionError('down')) as get:
+            items = list(client.fetch_items(range(100)))
+        self.assertEqual(items, [])
+        self.assertTrue(client.breaker.is_open())
+        self.assertLess(get.call_count, 10)
+
+
+class ShardedFetchTestCase(SimpleTestCase):
+    '''
+    Tests for fetching across a pool of processes
+    '''
+    def test_shard_workers_never_start_their_own_pool(self):
+        # Workers are spawned with the parent's environment, HN_FETCH_PROCESSES included
+        with self.settings(HN_FETCH_PROCESSES=4):
+            fetcher._init_shard_worker('http://localhost', 2, 1)
+        self.addCleanup(setattr, fetcher, '_shard_client', None)
+        self.assertEqual(fetcher._shard_client.processes, 1)
+
+    def test_sharded_fetch_returns_every_item(self):
+        corpus = HackerNewsCorpus.synthetic(stories=5, branching=2, depth=1)
+        with HackerNewsSimulator(corpus, seed=0) as simulator, mock.patch.dict(os.environ, HN_FETCH_PROCESSES='2'):
+            with self.settings(HN_FETCH_SHARD_SIZE=4), HackerNewsClient(simulator.url, processes=2) as client:
+                items = list(client.fetch_items(corpus.items))
+        self.assertEqual(sorted(item['id'] for item in items), sorted(corpus.items))
+        self.assertEqual(client.latency.count, len(corpus.items))
+
+
+class AdaptiveLimiterTestCase(SimpleTestCase):
+    '''
+    Tests for the adaptive concurrency limit
+    '''
+    def test_limit_grows_while_healthy_and_halves_on_errors(self):
+        limiter = AdaptiveLimiter(minimum=2, maximum=8, target_latency=1)
+        for _ in range(50):
+            limiter.record(0.1, ok=True)
+        self.assertEqual(limiter.limit, 8)
+
+        # Errors halve the limit once per window, never below the minimum
+        for _ in range(4):
+            limiter.record(0.1, ok=False)
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(50):
+            limiter.record(5, ok=True)
+        self.assertEqual(limiter.limit, 2)
+
+
+    def test_threads_share_a_limiter_and_a_breaker(self):
+        # Every update made from the fetch threads is counted
+        limiter = AdaptiveLimiter(minimum=1, maximum=10_000, target_latency=1)
+        breaker = CircuitBreaker(threshold=10_000)
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: (limiter.record(0.1, ok=True), breaker.record_failure()), range(2000)))
+        self.assertEqual((limiter.since_decrease, breaker.failures), (2000, 2000))
+
+
+class IncrementalSyncTestCase(TestCase):
+    '''
+    Tests for the incremental top stories sync
+    '''
+    def setUp(self):
+        self.items = {
+            item_id: {"id": item_id, "type": "story", "title": f"Story {item_id}", "score": 1, "time": 1686000000}
+            for item_id in range(1, 6)
+        }
+
+    def run_sync(self, client, mode='incremental'):
+        with mock.patch('webapp.tasks.HackerNewsClient', client):
+            return make_request(mode=mode)
+
+    def test_first_run_fetches_everything(self):
+        # Without a high-water mark the job falls back to a full sync
+        client = FakeHackerNewsClient(self.items, top_stories=[1, 2, 3])
+        stats = self.run_sync(client)
+        self.assertEqual(stats, {'fetched': 3, 'skipped': 0, 'written': 3, 'paused': False})
+        self.assertEqual(HackerNewsPost.objects.count(), 3)
+        self.assertEqual(SyncState.objects.get(name='make_request').high_water_mark, 5)
+
+    def test_next_run_fetches_only_new_and_changed_items(self):
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]))
+
+        # Item 4 is new, item 2 changed upstream and item 5 changed but is not stored
+        client = FakeHackerNewsClient(self.items, top_stories=[1, 2, 3, 4], updates=[2, 5])
+        stats = self.run_sync(client)
+        self.assertEqual(sorted(client.fetched), [2, 4])
+        # Item 2 was reported as changed but its content is identical, so only item 4 is written; only the stored
+        # items 1 and 3 count as skipped
+        self.assertEqual(stats, {'fetched': 2, 'skipped': 2, 'written': 1, 'paused': False})
+        self.assertEqual(SyncState.objects.get(name='make_request').changed_ids, [])
+
+    def test_full_mode_refetches_the_top_stories(self):
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]))
+
+        # Every item is fetched again but only the changed one is written
+        self.items[1]['score'] = 10
+        client = FakeHackerNewsClient(self.items, top_stories=[1, 2, 3])
+        stats = self.run_sync(client, mode='full')
+        self.assertEqual(stats, {'fetched': 3, 'skipped': 0, 'written': 1, 'paused': False})
+
+    def test_writes_bump_the_data_generation(self):
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]))
+        self.assertEqual(current_generation(), 1)
+
+        # Nothing written, nothing to invalidate
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]), mode='full')
+        self.assertEqual(current_generation(), 1)
+
+    def test_every_run_is_recorded(self):
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]))
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3, 4], updates=[2]))
+
+        run = IngestionRun.objects.filter(job='make_request').latest('started_at')
+        self.assertEqual((run.fetched, run.skipped, run.written, run.max_queue_depth), (2, 2, 1, 2))
+        self.assertEqual(run.unchanged_ratio, 0.5)
+        self.assertEqual(set(run.stage_seconds), {'fetch_wait', 'db_write', 'other'})
+
+    def test_unavailable_listings_end_the_run(self):
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]))
+        state = SyncState.objects.get(name='make_request')
+
+        # The listings fail after their retries: the run is recorded as failed and the sync state is kept
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        with mock.patch.object(client, 'top_stories', side_effect=requests.ConnectionError):
+            stats = self.run_sync(client)
+        self.assertEqual(stats, {'fetched': 0, 'skipped': 0, 'written': 0, 'paused': False, 'failed': True})
+        self.assertTrue(IngestionRun.objects.filter(job='make_request').latest('started_at').failed)
+        self.assertEqual(SyncState.objects.get(name='make_request').high_water_mark, state.high_water_mark)
+
+        # With the breaker open the run is paused rather than failed
+        client.breaker.trip()
+        with mock.patch.object(client, 'max_item', side_effect=CircuitOpenError):
+            stats = self.run_sync(client)
+        self.assertEqual((stats['paused'], stats['failed']), (True, False))
+
+    def test_old_runs_are_pruned(self):
+        with self.settings(INGESTION_RUN_RETENTION=2):
+            for _ in range(3):
+                self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1]), mode='full')
+        self.assertEqual(IngestionRun.objects.filter(job='make_request').count(), 2)
+
+        # The totals still count the pruned run
+        total = IngestionTotal.objects.get(job='make_request')
+        self.assertEqual((total.runs, total.fetched, total.written), (3, 3, 1))
+
+    def test_failed_runs_are_recorded(self):
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        with mock.patch.object(client, 'fetch_items', side_effect=requests.ConnectionError), self.assertRaises(requests.ConnectionError):
+            self.run_sync(client)
+
+        run = IngestionRun.objects.get(job='make_request')
+        self.assertTrue(run.failed)
+        total = IngestionTotal.objects.get(job='make_request')
+        self.assertEqual((total.runs, total.failed_runs), (1, 1))
+
+
+    def test_changed_items_gone_upstream_are_dropped(self):
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]))
+
+        # Item 2 changed and was then deleted: the API answers null, which a retry won't change
+        client = FakeHackerNewsClient({**self.items, 2: None}, top_stories=[1, 3], updates=[2])
+        self.run_sync(client)
+        self.assertIn(2, client.fetched)
+        self.assertEqual(SyncState.objects.get(name='make_request').changed_ids, [])
+
+    def test_changed_comments_are_written_as_comments(self):
+        self.items[6] = {"id": 6, "type": "comment", "by": "alice", "parent": 1, "text": "Hi", "time": 1686000000}
+        self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3]))
+        upsert_items([self.items[6]], COMMENT_FIELDS)
+
+        # The comment is edited: it is refetched and keeps its thread and its place in the rollups
+        self.items[6] = {**self.items[6], "text": "Hi, edited"}
+        stats = self.run_sync(FakeHackerNewsClient(self.items, top_stories=[1, 2, 3], updates=[6]))
+        self.assertEqual(stats['written'], 1)
+        comment = HackerNewsPost.objects.get(post_id=6)
+        self.assertEqual((comment.text, comment.parent_id, comment.story_id), ("Hi, edited", 1, 1))
+        author = Author.objects.get(name="alice")
+        self.assertEqual((author.submissions, author.comments), (0, 1))
+
+        # It is fingerprinted like the crawler's comments, so the crawler doesn't write it again
+        self.assertEqual(upsert_items([self.items[6]], COMMENT_FIELDS), 0)
+
+class UpsertItemsTestCase(TestCase):
+    '''
+    Tests for the batched upsert stage used by the sync jobs
+    '''
+    def test_upsert_inserts_then_updates_owned_fields(self):
+        items = [{"id": item_id, "type": "story", "score": 1, "kids": [10], "descendants": 1} for item_id in range(1, 6)]
+        self.assertEqual(upsert_items(items, STORY_FIELDS, batch_size=2), 5)
+
+        # Identical items are not written again
+        modified = HackerNewsPost.objects.get(post_id=1).modified
+        self.assertEqual(upsert_items(items, STORY_FIELDS), 0)
+        self.assertEqual(HackerNewsPost.objects.get(post_id=1).modified, modified)
+
+        # Upserting again updates every owned field instead of creating duplicates
+        items[0].update(score=42, kids=[10, 11], descendants=2)
+        upsert_items(items[:1], STORY_FIELDS)
+        post = HackerNewsPost.objects.get(post_id=1)
+        self.assertEqual(HackerNewsPost.objects.count(), 5)
+        self.assertEqual((post.score, post.kids, post.descendants), (42, [10, 11], 2))
+
+    def test_upsert_comments_keeps_parent_and_kids(self):
+        upsert_items([{"id": 7, "type": "comment", "parent": 1, "kids": [8, 9], "text": "Hi"}], COMMENT_FIELDS)
+        comment = HackerNewsPost.objects.get(post_id=7)
+        self.assertEqual((comment.parent_id, comment.kids, comment.source), (1, [8, 9], 'Hacker API'))
+
+
+class CommentCrawlerTestCase(TestCase):
+    '''
+    Tests for the breadth-first comment tree crawler
+    '''
+    def setUp(self):
+        # Story 1 has two comments; comment 2 has a reply (4) which has a reply (5)
+        self.items = {
+            1: {"id": 1, "type": "story", "kids": [2, 3]},
+            2: {"id": 2, "type": "comment", "parent": 1, "kids": [4]},
+            3: {"id": 3, "type": "comment", "parent": 1},
+            4: {"id": 4, "type": "comment", "parent": 2, "kids": [5]},
+            5: {"id": 5, "type": "comment", "parent": 4},
+        }
+        upsert_items([self.items[1]], STORY_FIELDS)
+
+    def run_crawl(self, client):
+        with mock.patch('webapp.tasks.HackerNewsClient', client):
+            return get_children()
+
+    def test_crawl_walks_the_tree_up_to_the_depth_limit(self):
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        with self.settings(HN_CRAWL_MAX_DEPTH=2):
+            stats = self.run_crawl(client)
+        self.assertEqual(client.fetched, [2, 3, 4])
+        self.assertEqual(stats, {'fetched': 3, 'written': 3, 'queued': 1, 'fetch_errors': 0, 'paused': False, 'seeded': 2})
+        self.assertFalse(CrawlFrontier.objects.exists())
+        self.assertEqual(HackerNewsPost.objects.get(post_id=4).parent_id, 2)
+        self.assertEqual(dict(HackerNewsPost.objects.filter(parent__isnull=False).values_list('post_id', 'depth')), {2: 1, 3: 1, 4: 2})
+
+    def test_depth_limit_holds_across_runs(self):
+        with self.settings(HN_CRAWL_MAX_DEPTH=2):
+            self.run_crawl(FakeHackerNewsClient(self.items, top_stories=[1]))
+            client = FakeHackerNewsClient(self.items, top_stories=[1])
+            stats = self.run_crawl(client)
+
+        # Comment 4 is at the limit, so its reply is never fetched, not even by the next run
+        self.assertEqual(client.fetched, [])
+        self.assertEqual(stats['seeded'], 0)
+        self.assertFalse(HackerNewsPost.objects.filter(post_id=5).exists())
+
+    def test_new_replies_to_stored_comments_are_crawled(self):
+        self.run_crawl(FakeHackerNewsClient(self.items, top_stories=[1]))
+
+        # Comment 3 got a reply; its kids are refreshed when the comment is ingested again
+        self.items[3] = {**self.items[3], "kids": [6]}
+        self.items[6] = {"id": 6, "type": "comment", "parent": 3}
+        upsert_items([self.items[3]], COMMENT_FIELDS)
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        self.run_crawl(client)
+        self.assertEqual(client.fetched, [6])
+        self.assertEqual(HackerNewsPost.objects.get(post_id=6).depth, 2)
+
+    def test_comments_below_a_changed_post_are_fetched_again(self):
+        self.run_crawl(FakeHackerNewsClient(self.items, top_stories=[1]))
+
+        # The story changed, so its stored comments are refetched; comment 2 has a new reply, comment 3 is unchanged
+        self.items[2] = {**self.items[2], "kids": [4, 6]}
+        self.items[6] = {"id": 6, "type": "comment", "parent": 2}
+        upsert_items([{**self.items[1], "score": 2}], STORY_FIELDS)
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        self.run_crawl(client)
+        # Comment 4 is fetched again below the changed comment 2, and stops there as it didn't change
+        self.assertEqual(client.fetched, [2, 3, 4, 6])
+        self.assertTrue(HackerNewsPost.objects.filter(post_id=6, depth=2).exists())
+
+    def test_failed_fetches_are_retried_later(self):
+        # Comment 2 can't be fetched while the breaker stays closed: it stays queued and its subtree isn't lost
+        items = {**self.items, 2: None}
+        with self.settings(HN_CRAWL_MAX_ATTEMPTS=2):
+            stats = self.run_crawl(FakeHackerNewsClient(items, top_stories=[1]))
+            self.assertEqual(stats['fetch_errors'], 1)
+            entry = CrawlFrontier.objects.get()
+            self.assertEqual((entry.item_id, entry.attempts), (2, 1))
+            self.assertGreater(entry.retry_after, datetime.now(timezone.utc))
+
+            # Not before its backoff has passed
+            client = FakeHackerNewsClient(self.items, top_stories=[1])
+            self.run_crawl(client)
+            self.assertEqual(client.fetched, [])
+
+            CrawlFrontier.objects.update(retry_after=datetime.now(timezone.utc))
+            client = FakeHackerNewsClient(self.items, top_stories=[1])
+            self.run_crawl(client)
+            self.assertEqual(client.fetched, [2, 4, 5])
+
+            # An item that keeps failing is dropped once it runs out of attempts
+            CrawlFrontier.objects.create(item_id=7, depth=1, attempts=1)
+            self.run_crawl(FakeHackerNewsClient(self.items, top_stories=[1]))
+            self.assertFalse(CrawlFrontier.objects.exists())
+
+    def test_crawl_resumes_from_the_persisted_frontier(self):
+        # An interrupted run left comment 4 in the frontier, so nothing is seeded
+        CrawlFrontier.objects.create(item_id=4, depth=2)
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        stats = self.run_crawl(client)
+        self.assertEqual(client.fetched, [4, 5])
+        self.assertEqual(stats['seeded'], 0)
+
+    def test_next_seed_only_queues_kids_of_changed_items(self):
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        self.run_crawl(client)
+
+        # Nothing was ingested since the last checkpoint, so the next run has no work
+        client = FakeHackerNewsClient(self.items, top_stories=[1])
+        stats = self.run_crawl(client)
+        self.assertEqual(client.fetched, [])
+        self.assertEqual(stats['seeded'], 0)
+
+
+class LeaderLeaseTestCase(TestCase):
+    '''
+    Tests for the lease electing the single ingestion scheduler
+    '''
+    def test_only_one_holder_at_a_time(self):
+        self.assertTrue(acquire_lease('scheduler', 'worker-1', ttl=60))
+        self.assertFalse(acquire_lease('scheduler', 'worker-2', ttl=60))
+
+        # The holder can renew its own lease
+        self.assertTrue(acquire_lease('scheduler', 'worker-1', ttl=60))
+
+    def test_expired_or_released_lease_can_be_taken_over(self):
+        acquire_lease('scheduler', 'worker-1', ttl=-1)
+        self.assertTrue(acquire_lease('scheduler', 'worker-2', ttl=60))
+
+        release_lease('scheduler', 'worker-2')
+        self.assertTrue(acquire_lease('scheduler', 'worker-1', ttl=60))
+
+
+    def test_worker_survives_database_errors_renewing_the_lease(self):
+        # Renewals fail twice in a row while the database is locked, then succeed again
+        clock = mock.Mock(monotonic=mock.Mock(side_effect=[0, 10, 20, 30]))
+        locked = OperationalError('database is locked')
+        scheduler = mock.Mock()
+        with mock.patch('webapp.management.commands.ingestion_worker.acquire_lease', side_effect=[True, locked, locked, True, KeyboardInterrupt]), \
+                mock.patch('webapp.management.commands.ingestion_worker.create_scheduler', return_value=scheduler) as create_scheduler, \
+                mock.patch('webapp.management.commands.ingestion_worker.time', clock):
+            call_command('ingestion_worker', lease_ttl=30, stdout=io.StringIO(), stderr=io.StringIO())
+
+        # One failure leaves time to renew; after the second the lease may lapse, so scheduling stops until it is renewed
+        self.assertEqual(create_scheduler.call_count, 2)
+        self.assertEqual(scheduler.shutdown.call_count, 2)
+
+class SimulatedSyncTestCase(TestCase):
+    '''
+    End-to-end tests of both sync jobs against the local Hacker News simulator
+    '''
+    def setUp(self):
+        # 5 stories with 2 comments each, and 2 replies under every comment
+        self.corpus = HackerNewsCorpus.synthetic(stories=5, branching=2, depth=2)
+        self.simulator = HackerNewsSimulator(self.corpus, seed=0)
+        self.simulator.start()
+        self.addCleanup(self.simulator.stop)
+
+    def test_sync_jobs_ingest_the_whole_corpus(self):
+        with self.settings(HN_API_URL=self.simulator.url):
+            make_request(mode='full')
+            stats = get_children()
+        self.assertEqual(stats['fetched'], 30)
+        self.assertEqual(HackerNewsPost.objects.count(), len(self.corpus.items))
+        self.assertEqual(HackerNewsPost.objects.filter(parent__isnull=True).count(), 5)
+
+
+class ExportPostsCommandTestCase(TestCase):
+    '''
+    Tests for the export_posts management command
+    '''
+    def test_export_to_gzipped_file(self):
+        HackerNewsPost.objects.create(post_id=1, type='story', title='Story')
+        HackerNewsPost.objects.create(post_id=2, type='job', title='Job')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.ndjson.gz')
+            call_command('export_posts', '--type', 'job', '--gzip', '--chunk-size', '1', '--output', path)
+            with gzip.open(path, 'rt') as export:
+                rows = [json.loads(line) for line in export]
+        self.assertEqual([(row['post_id'], row['title']) for row in rows], [(2, 'Job')])
+
+
+    def test_export_reads_one_chunk_per_query(self):
+        for post_id in range(1, 4):
+            HackerNewsPost.objects.create(post_id=post_id, type='story')
+        chunks = iter_ndjson(export_queryset(), chunk_size=2)
+        with self.assertNumQueries(1):
+            first = next(chunks)
+
+        # Nothing is held open between chunks; the next one continues after the last id sent
+        HackerNewsPost.objects.create(post_id=4, type='story')
+        body = (first + b''.join(chunks)).decode()
+        self.assertEqual([json.loads(line)['post_id'] for line in body.splitlines()], [1, 2, 3, 4])
+
+class SearchTestCase(TestCase):
+    '''
+    Tests for the full-text search index
+    '''
+    def setUp(self):
+        cache.clear()
+        HackerNewsPost.objects.create(post_id=1, type='story', title='Rust compiler internals', by='alice')
+        HackerNewsPost.objects.create(post_id=2, type='story', title='Show HN: a tiny database', text='Written in Rust', by='bob')
+        HackerNewsPost.objects.create(post_id=3, type='job', title='Hiring Python developers', by='rustacean')
+
+    def search(self, text):
+        return list(search_posts(HackerNewsPost.objects.all(), text).order_by('search_rank').values_list('post_id', flat=True))
+
+    def test_search_title_text_and_author_by_relevance(self):
+        # The title match ranks first; the body match and the author prefix match follow
+        results = self.search('rust')
+        self.assertEqual(results[0], 1)
+        self.assertEqual(sorted(results), [1, 2, 3])
+        self.assertEqual(self.search('tiny DATA'), [2])
+        self.assertEqual(self.search('"NEAR(* OR'), [])
+
+    def test_snippets_highlight_matches(self):
+        post = search_posts(HackerNewsPost.objects.filter(post_id=2), 'written').get()
+        self.assertIn(f'{HIGHLIGHT_START}Written{HIGHLIGHT_END}', post.search_snippet)
+
+    def test_index_follows_writes(self):
+        HackerNewsPost.objects.filter(post_id=3).update(title='Hiring Go developers')
+        HackerNewsPost.objects.filter(post_id=1).delete()
+        upsert_items([{"id": 4, "type": "story", "title": "Python packaging", "time": 1686000000}], STORY_FIELDS)
+        self.assertEqual(self.search('python'), [4])
+        self.assertEqual(self.search('go'), [3])
+        self.assertEqual(self.search('compiler'), [])
+
+    def test_search_without_words_matches_nothing(self):
+        self.assertEqual(self.search('!!!'), [])
+        response = self.client.get('/', {'search': '!!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['posts']), [])
+        response = self.client.get('/api/all-posts/', {'search': '!!!'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_homepage_search(self):
+        response = self.client.get('/', {'search': 'database'})
+        self.assertEqual([post.post_id for post in response.context['posts']], [2])
+        self.assertContains(response, '<mark>database</mark>')
+
+
+class CommentThreadTestCase(TestCase):
+    '''
+    Tests for loading the comment thread of a post
+    '''
+    def setUp(self):
+        cache.clear()
+        # A story with two replies (listed newest first by Hacker News), one of them with a chain of nested replies
+        self.story = HackerNewsPost.objects.create(post_id=1, type='story', title='Story', kids=[3, 2])
+        HackerNewsPost.objects.create(post_id=2, type='comment', parent_id=1, text='First', kids=[4])
+        HackerNewsPost.objects.create(post_id=3, type='comment', parent_id=1, text='Second')
+        HackerNewsPost.objects.create(post_id=4, type='comment', parent_id=2, text='Reply', kids=[5])
+        HackerNewsPost.objects.create(post_id=5, type='comment', parent_id=4, text='Nested reply')
+
+    def test_tree_is_loaded_with_one_query_per_level(self):
+        # Three levels of replies, plus the query finding there is no fourth
+        with self.assertNumQueries(4):
+            comments = load_comment_tree(self.story, max_depth=10)
+        self.assertEqual([comment.post_id for comment in comments], [3, 2])
+        self.assertEqual(comments[1].replies[0].replies[0].text, 'Nested reply')
+
+    def test_wide_levels_are_loaded_in_chunks(self):
+        # The two replies to the story are read one parent at a time
+        with self.settings(COMMENT_TREE_CHUNK_SIZE=1), self.assertNumQueries(5):
+            comments = load_comment_tree(self.story, max_depth=10)
+        self.assertEqual([comment.post_id for comment in comments], [3, 2])
+        self.assertEqual(comments[1].replies[0].replies[0].text, 'Nested reply')
+
+    def test_depth_is_bounded(self):
+        with self.assertNumQueries(2):
+            comments = load_comment_tree(self.story, max_depth=2)
+        reply = comments[1].replies[0]
+        self.assertEqual((reply.replies, reply.more_replies), ([], 1))
+
+    def test_detail_page_renders_the_thread(self):
+        response = self.client.get(f'/post/{self.story.id}/')
+        self.assertContains(response, 'Nested reply')
+        self.assertContains(response, 'id="comment-5"')
+
+    async def test_async_detail_page_matches_the_sync_one(self):
+        page = (await sync_to_async(self.client.get)(f'/post/{self.story.id}/')).content
+        cache.clear()
+        response = await self.async_client.get(f'/async/post/{self.story.id}/')
+        self.assertEqual(response.content, page)
+        self.assertEqual((await self.async_client.get('/async/post/404/')).status_code, 404)
+
+    async def test_async_tree_is_loaded_with_one_query_per_level(self):
+        comments = await aload_comment_tree(self.story, max_depth=10)
+        self.assertEqual([comment.post_id for comment in comments], [3, 2])
+        self.assertEqual(comments[1].replies[0].replies[0].text, 'Nested reply')
+
+
+class HomePaginationTestCase(TestCase):
+    '''
+    Tests for the capped, windowed homepage pagination
+    '''
+    def setUp(self):
+        cache.clear()
+        start = datetime(2023, 6, 1, tzinfo=timezone.utc)
+        HackerNewsPost.objects.bulk_create(
+            HackerNewsPost(post_id=index, type='job' if index % 3 else 'story', title=f'Post {index}', time=start + timedelta(minutes=index))
+            for index in range(1, 41)
+        )
+
+    def post_ids(self, response):
+        return [post.post_id for post in response.context['posts']]
+
+    def test_page_links_are_windowed_and_keep_the_filters(self):
+        with self.settings(HOME_MAX_PAGES=100):
+            response = self.client.get('/', {'type': 'job', 'page': 1})
+        # 26 jobs make 3 pages of 9
+        self.assertEqual(list(response.context['page_links']), [1, 2, 3])
+        self.assertContains(response, 'href="?type=job&amp;page=2"')
+
+        with self.settings(HOME_MAX_PAGES=100):
+            response = self.client.get('/', {'page': 3})
+        self.assertEqual(list(response.context['page_links']), [1, 2, 3, 4, 5])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_older_posts_are_reached_with_a_cursor(self):
+        with self.settings(HOME_MAX_PAGES=2):
+            response = self.client.get('/', {'page': 2})
+            self.assertEqual(response.context['paginator'].num_pages, 2)
+            self.assertEqual(self.post_ids(response), list(range(31, 22, -1)))
+
+            # Past the numbered pages the homepage seeks from the last post shown
+            response = self.client.get('/', {'after': response.context['next_cursor']})
+            self.assertEqual(self.post_ids(response), list(range(22, 13, -1)))
+            response = self.client.get('/', {'after': response.context['next_cursor']})
+            response = self.client.get('/', {'after': response.context['next_cursor']})
+            self.assertEqual(self.post_ids(response), [4, 3, 2, 1])
+            self.assertIsNone(response.context['next_cursor'])
+
+            self.assertEqual(self.client.get('/', {'page': 3}).status_code, 404)
+            self.assertEqual(self.client.get('/', {'after': 'garbage'}).status_code, 404)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTestCase(TestCase):
+    '''
+    Regression tests making sure the queries the views and jobs actually run stay on an index:
+    every query is captured while the view or job runs, then explained
+    '''
+    def setUp(self):
+        cache.clear()
+        now = datetime.now(timezone.utc)
+        for post_id in range(1, 13):
+            HackerNewsPost.objects.create(
+                post_id=post_id, type='job' if post_id % 3 == 0 else 'story', by='alice', title=f'Rust {post_id}',
+                time=now - timedelta(hours=post_id), hot_score=post_id, kids=[101] if post_id == 1 else None, source='Hacker API',
+            )
+        HackerNewsPost.objects.create(post_id=101, type='comment', parent_id=1, story_id=1, by='bob', text='Reply', time=now)
+        Author.objects.create(name='alice', submissions=12, score=0)
+
+    def captured_plans(self, run):
+        # The query plan of every SELECT run by `run`; Django logs the SQL of SQLite queries with their parameters inlined
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans, 'No query was captured')
+        return plans
+
+    def assertIndexed(self, run, ordered_walk=False, sort=False):
+        '''
+        Fail on any SCAN step: a table read without an index, or a walk of a whole index. Listing first pages
+        may walk an index in order (`ordered_walk`), since they stop at the page size; only a relevance ranking
+        may sort its results (`sort`)
+        '''
+        plans = self.captured_plans(run)
+        for sql, plan in plans:
+            # An exists() probe stops at the first row
+            if sql.startswith('SELECT 1 AS "a"') and sql.endswith('LIMIT 1'):
+                continue
+            for step in plan:
+                if step.startswith('SCAN') and not any(exempt in step for exempt in ('VIRTUAL TABLE', 'SCAN subquery', 'CONSTANT ROW')):
+                    self.assertTrue(ordered_walk and 'INDEX' in step, f'Full scan in {plan} of {sql}')
+                if 'TEMP B-TREE FOR ORDER BY' in step:
+                    self.assertTrue(sort, f'Sort in {plan} of {sql}')
+        return plans
+
+    def assertSearches(self, run, *bounds):
+        # The listing query is an index search bounded by every one of `bounds`, e.g. 'time<?'
+        plans = self.assertIndexed(run)
+        steps = [step for _, plan in plans for step in plan if 'webapp_hackernewspost' in step]
+        for bound in bounds:
+            self.assertTrue(any(step.startswith('SEARCH') and bound in step for step in steps), f'No search on {bound} in {steps}')
+
+    def get(self, path):
+        response = self.client.get(path, HTTP_ACCEPT='application/json')
+        self.assertLess(response.status_code, 400, path)
+        return response
+
+    def test_homepage_queries(self):
+        self.assertIndexed(lambda: self.get('/'), ordered_walk=True)
+        self.assertIndexed(lambda: self.get('/?type=job'))
+        self.assertIndexed(lambda: self.get('/?page=2'), ordered_walk=True)
+        self.assertIndexed(lambda: self.get('/?sort=hot'))
+        self.assertIndexed(lambda: self.get('/?search=rust'), sort=True)
+        cursor = encode_position(HackerNewsPost.objects.get(post_id=5))
+        self.assertSearches(lambda: self.get(f'/?after={cursor}'), 'time<?')
+
+    def test_api_queries(self):
+        self.assertSearches(lambda: self.get('/api/all-posts/'), 'parent=?')
+        self.assertSearches(lambda: self.get('/api/all-posts/?type=job&type=story'), 'parent=?')
+        response = self.get('/api/all-posts/?page_size=2')
+        self.assertSearches(lambda: self.get(response.json()['next']), 'parent=?', 'time<?')
+        previous = self.get(response.json()['next']).json()['previous']
+        self.assertSearches(lambda: self.get(previous), 'parent=?', 'time>?')
+        self.assertSearches(lambda: self.get('/api/top/'), 'parent=?')
+        self.assertSearches(lambda: self.get('/api/posts/?ids=1,2,3'), 'post_id=?')
+        self.assertSearches(lambda: self.get('/api/post/1/'), 'post_id=?')
+        # A filtered export chunk reads the changed posts through the (source, modified) index and sorts them by id
+        self.assertIndexed(lambda: b''.join(self.get('/api/export/?since=2023-06-01&source=Hacker%20API').streaming_content), sort=True)
+        # The leaderboards walk their ranking index down to the page size
+        self.assertIndexed(lambda: self.get('/api/stats/'), ordered_walk=True)
+
+    def test_author_feed_queries(self):
+        self.assertSearches(lambda: self.get('/api/users/alice/'), 'by=?')
+        response = self.get('/api/users/alice/?page_size=2')
+        self.assertSearches(lambda: self.get(response.json()['next']), 'by=?', 'time<?')
+
+    def test_detail_page_queries(self):
+        self.assertSearches(lambda: self.get(f'/post/{HackerNewsPost.objects.get(post_id=1).pk}/'), 'parent=?')
+
+    def test_job_queries(self):
+        items = {1: {"id": 1, "type": "story", "by": "alice", "kids": [101, 102], "time": 1686000000}}
+        items[102] = {"id": 102, "type": "comment", "by": "bob", "parent": 1, "time": 1686000000}
+        client = FakeHackerNewsClient(items, top_stories=[1])
+        with mock.patch('webapp.tasks.HackerNewsClient', client), self.settings(HN_SYNC_MODE='full'):
+            self.assertIndexed(make_request)
+            # The crawl takes its batches off the front of the frontier's (depth, item_id) index
+            self.assertIndexed(get_children, ordered_walk=True)
+        self.assertIndexed(refresh_hot_scores)
+
+class HotRankingTestCase(TestCase):
+    '''
+    Tests for the precomputed hot ranking
+    '''
+    def setUp(self):
+        cache.clear()
+        self.now = datetime.now(timezone.utc)
+
+    def story(self, item_id, score, hours_ago):
+        return {"id": item_id, "type": "story", "title": f"Story {item_id}", "score": score, "time": int((self.now - timedelta(hours=hours_ago)).timestamp())}
+
+    def test_score_decays_with_age(self):
+        self.assertAlmostEqual(hot_score(101, self.now, self.now), 100 / 2 ** 1.8)
+        self.assertLess(hot_score(101, self.now - timedelta(hours=10), self.now), hot_score(20, self.now, self.now))
+        self.assertEqual(hot_score(None, self.now, self.now), 0)
+
+    def test_ingest_ranks_top_level_items_only(self):
+        upsert_items([self.story(1, 50, 1), self.story(2, 500, 20), self.story(3, 500, 24 * 30)], STORY_FIELDS)
+        upsert_items([{"id": 4, "type": "comment", "parent": 1, "text": "Reply", "time": 1686000000}], COMMENT_FIELDS)
+        ranked = HackerNewsPost.objects.filter(hot_score__isnull=False).order_by('-hot_score').values_list('post_id', flat=True)
+        # Story 3 is older than the ranking window
+        self.assertEqual(list(ranked), [1, 2])
+
+    def test_refresh_reranks_as_posts_age(self):
+        upsert_items([self.story(1, 50, 1), self.story(2, 40, 1)], STORY_FIELDS)
+        HackerNewsPost.objects.filter(post_id=1).update(time=self.now - timedelta(days=30))
+        HackerNewsPost.objects.filter(post_id=2).update(time=self.now - timedelta(hours=5))
+        stats = refresh_hot_scores()
+        self.assertEqual(stats, {'ranked': 1, 'dropped': 1})
+        post = HackerNewsPost.objects.get(post_id=2)
+        self.assertAlmostEqual(post.hot_score, hot_score(40, post.time, self.now), places=3)
+
+    def test_homepage_hot_sort(self):
+        upsert_items([self.story(1, 10, 1), self.story(2, 300, 1), self.story(3, 100, 0)], STORY_FIELDS)
+        response = self.client.get('/', {'sort': 'hot'})
+        self.assertEqual([post.post_id for post in response.context['posts']], [2, 3, 1])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class RollupTestCase(TestCase):
+    '''
+    Tests for the statistics rollups kept by the sync jobs and their reconciliation
+    '''
+    def setUp(self):
+        # Story 1 by alice has a thread of three comments; story 6 by bob has none
+        self.items = {
+            1: {"id": 1, "type": "story", "by": "alice", "score": 10, "kids": [2, 3], "time": 1686000000},
+            2: {"id": 2, "type": "comment", "by": "bob", "parent": 1, "kids": [4], "time": 1686000100},
+            3: {"id": 3, "type": "comment", "by": "alice", "parent": 1, "time": 1686003700},
+            4: {"id": 4, "type": "comment", "by": "bob", "parent": 2, "time": 1686003800},
+            6: {"id": 6, "type": "story", "by": "bob", "score": 5, "time": 1686003900},
+        }
+        upsert_items([self.items[1], self.items[6]], STORY_FIELDS)
+        with mock.patch('webapp.tasks.HackerNewsClient', FakeHackerNewsClient(self.items, top_stories=[1, 6])):
+            get_children()
+
+    def rollups(self):
+        return (
+            sorted(HourlyTypeCount.objects.filter(posts__gt=0).values_list('type', 'hour', 'posts')),
+            sorted(StoryCommentCount.objects.values_list('story_id', 'comments')),
+            sorted(Author.objects.values_list('name', 'submissions', 'comments', 'score')),
+        )
+
+    def test_sync_jobs_count_posts_comments_and_authors(self):
+        hourly, stories, authors = self.rollups()
+        hour = datetime(2023, 6, 5, 21, tzinfo=timezone.utc)
+        self.assertEqual(hourly, [('comment', hour, 1), ('comment', hour + timedelta(hours=1), 2), ('story', hour, 1), ('story', hour + timedelta(hours=1), 1)])
+        self.assertEqual(stories, [(1, 3)])
+        self.assertEqual(authors, [('alice', 1, 1, 10), ('bob', 1, 2, 5)])
+
+        # A new score only moves the author's total by the difference
+        upsert_items([{**self.items[1], "score": 25}], STORY_FIELDS)
+        self.assertEqual(Author.objects.get(name='alice').score, 25)
+
+    def test_deltas_increment_the_stored_counts(self):
+        # Counts moved by another writer since are kept: the deltas are added in the database, not over a stale read
+        Author.objects.filter(name='alice').update(submissions=F('submissions') + 10)
+        upsert_items([{"id": 9, "type": "story", "by": "alice", "score": 1, "time": 1686000000}], STORY_FIELDS)
+        upsert_items([{"id": 10, "type": "story", "by": "carol", "time": 1686000000}], STORY_FIELDS)
+        self.assertEqual(list(Author.objects.filter(name__in=['alice', 'carol']).order_by('name').values_list('submissions', 'score')), [(12, 11), (1, 0)])
+
+    def test_reconcile_rebuilds_the_same_rollups(self):
+        incremental = self.rollups()
+        Author.objects.update(score=0)
+        StoryCommentCount.objects.all().delete()
+        reconcile_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_reconcile_finds_threads_of_comments_stored_before_their_parent(self):
+        # A reply stored before its parent can't be counted until the parent arrives
+        upsert_items([{"id": 8, "type": "comment", "parent": 7, "time": 1686000000}], COMMENT_FIELDS)
+        upsert_items([{"id": 7, "type": "comment", "parent": 6, "kids": [8], "time": 1686000000}], COMMENT_FIELDS)
+        self.assertEqual(StoryCommentCount.objects.get(story_id=6).comments, 1)
+        stats = reconcile_rollups()
+        self.assertEqual(stats['story_ids'], 1)
+        self.assertEqual(StoryCommentCount.objects.get(story_id=6).comments, 2)
+        self.assertEqual(HackerNewsPost.objects.get(post_id=8).story_id, 6)
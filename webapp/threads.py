@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.db.models import Case, Exists, F, OuterRef, Q, Subquery, When
+
+from webapp.models import HackerNewsPost
+from webapp.utils import chunked
+
+# Columns the comment thread template needs
+COMMENT_FIELDS = ['id', 'post_id', 'parent_id', 'by', 'time', 'text', 'kids', 'type']
+
+
+def sibling_order(parent):
+    # Hacker News ranks replies in the parent's kids list; fall back to time for kids it doesn't list
+    position = {kid: index for index, kid in enumerate(parent.kids or [])}
+    return lambda comment: (position.get(comment.post_id, len(position)), comment.time is None, comment.time)
+
+
+def build_comment_tree(post, max_depth=None):
+    '''
+    Generator assembling the thread below `post` without running any query itself:
+    it yields the querysets of each level and is sent back their rows, so the
+    sync and async loaders share it
+    '''
+    max_depth = max_depth or settings.COMMENT_TREE_MAX_DEPTH
+    post.replies = []
+    level = {post.post_id: post}
+
+    for _ in range(max_depth):
+        # Wide levels are read in chunks of parents so the IN list stays under the database's parameter limit
+        children = []
+        for parent_ids in chunked(level, settings.COMMENT_TREE_CHUNK_SIZE):
+            children += yield HackerNewsPost.objects.filter(parent_id__in=parent_ids).only(*COMMENT_FIELDS)
+        if not children:
+            break
+
+        # Attach each reply to its parent, then order the siblings
+        for comment in children:
+            comment.replies = []
+            comment.more_replies = 0
+            level[comment.parent_id].replies.append(comment)
+        for parent in level.values():
+            parent.replies.sort(key=sibling_order(parent))
+        level = {comment.post_id: comment for comment in children}
+    else:
+        # Replies below the depth limit are counted but not loaded
+        for comment in level.values():
+            comment.more_replies = len(comment.kids or [])
+    return post.replies
+
+
+def load_comment_tree(post, max_depth=None):
+    '''
+    Load the replies below `post`, one query per level (per chunk of a wide level) down to `max_depth`,
+    and return its direct replies with each comment's own replies in `.replies`
+    '''
+    builder = build_comment_tree(post, max_depth)
+    try:
+        level = next(builder)
+        while True:
+            level = builder.send(list(level))
+    except StopIteration as done:
+        return done.value
+
+
+async def aload_comment_tree(post, max_depth=None):
+    '''load_comment_tree for async views, reading each level with the async ORM'''
+    builder = build_comment_tree(post, max_depth)
+    try:
+        level = next(builder)
+        while True:
+            level = builder.send([comment async for comment in level])
+    except StopIteration as done:
+        return done.value
+
+
+def assign_stories(comments):
+    '''Set the story_id and depth of unsaved comments from their stored parents, with one query'''
+    parent_ids = {comment.parent_id for comment in comments if comment.parent_id is not None}
+    parents = HackerNewsPost.objects.filter(post_id__in=parent_ids).values_list('post_id', 'parent_id', 'story_id', 'depth')
+
+    # A reply to a top-level post starts its thread, a reply to a comment joins the comment's thread one level down
+    stories = {}
+    for post_id, parent_id, story_id, depth in parents:
+        if parent_id is None:
+            stories[post_id] = post_id, 1
+        else:
+            stories[post_id] = story_id, None if depth is None else depth + 1
+    for comment in comments:
+        comment.story_id, comment.depth = stories.get(comment.parent_id, (None, None))
+    return comments
+
+
+def backfill_story_ids():
+    '''
+    Set the story_id and depth of comments stored before their parent, one thread
+    level per query, and return how many were set
+    '''
+    parents = HackerNewsPost.objects.filter(post_id=OuterRef('parent_id'))
+    resolved = parents.filter(Q(parent__isnull=True) | Q(story_id__isnull=False))
+    story = resolved.annotate(story=Case(When(parent__isnull=True, then='post_id'), default='story_id')).values('story')[:1]
+    depth = resolved.annotate(level=Case(When(parent__isnull=True, then=1), default=F('depth') + 1)).values('level')[:1]
+
+    assigned = 0
+    while True:
+        # Only comments whose parent knows its thread, so every pass makes progress
+        updated = (
+            HackerNewsPost.objects.filter(parent__isnull=False, story_id__isnull=True)
+            .filter(Exists(resolved)).update(story_id=Subquery(story), depth=Subquery(depth))
+        )
+        if not updated:
+            return assigned
+        assigned += updated
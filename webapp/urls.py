@@ -6,4 +6,5 @@ app_name = 'webapp'
 urlpatterns = [
     path('', views.PostListView.as_view(), name='home'), # the home page endpoint
     path('post/<int:pk>/', views.PostDetailView.as_view(), name='post-detail' ), # a single post endpoint
+    path('async/post/<int:pk>/', views.AsyncPostDetailView.as_view(), name='async-post-detail'), # the single post endpoint on the async ORM, for ASGI
 ]
@@ -0,0 +1,38 @@
+from itertools import islice
+
+
+def chunked(iterable, size):
+    # Split any iterable (including a stream of fetched items) into lists of at most `size` elements
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# Upper bounds (in seconds) of the fetch latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Histogram:
+    '''Cumulative histogram with Prometheus-style buckets'''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def merge(self, other):
+        # Add another histogram with the same buckets, e.g. one returned by a fetch process
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def as_dict(self):
+        return {'buckets': self.buckets, 'counts': self.counts, 'sum': round(self.sum, 6), 'count': self.count}
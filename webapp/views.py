@@ -1,14 +1,34 @@
-from ast import literal_eval
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.views import View
 from django.views.generic import ListView, DetailView
+from webapp.cache import aget_or_compute, get_or_compute
 from webapp.models import HackerNewsPost, TYPES
+from webapp.pagination import CappedPaginator, decode_position, encode_position, older_than
+from webapp.search import search_posts
+from webapp.threads import aload_comment_tree, load_comment_tree
 
 
-class PostListView(ListView):
+class CachedPageMixin:
+    '''Serve the rendered page from the cache until a write bumps the data generation'''
+    cache_name = None
+
+    def get(self, request, *args, **kwargs):
+        # The pages don't depend on the user, so the query string and URL arguments identify them
+        params = dict(request.GET.lists(), **{name: [value] for name, value in kwargs.items()})
+        render = lambda: super(CachedPageMixin, self).get(request, *args, **kwargs).render().content
+        return HttpResponse(get_or_compute(self.cache_name, params, render))
+
+
+class PostListView(CachedPageMixin, ListView):
+    cache_name = 'home'
     model = HackerNewsPost
     template_name = 'webapp/home.html'
     context_object_name = 'posts'
-    ordering = ['-time']
-    paginate_by = '9'
+    ordering = ['-time', '-id']
+    paginate_by = 9
+    paginator_class = CappedPaginator
     
     def get_queryset(self):
         # Retrieve the initial queryset
@@ -25,19 +45,62 @@ class PostListView(ListView):
         # Filter by search query specified in the request parameters
         search_query = self.request.GET.get('search')
         if search_query:
-            queryset = queryset.filter(text__icontains=search_query)
+            # Most relevant first, newest first among equally relevant posts
+            queryset = search_posts(queryset, search_query).order_by('search_rank', '-time')
+        elif self.request.GET.get('sort') == 'hot':
+            # Ranked posts by their precomputed hot score: a scan of the (parent, hot_score) index
+            queryset = queryset.filter(parent__isnull=True, hot_score__isnull=False).order_by('-hot_score', '-id')
         return queryset
+
+    def is_seekable(self):
+        # Only the newest first order can be continued from a (time, id) cursor
+        return not self.request.GET.get('search') and self.request.GET.get('sort') != 'hot'
     
+    def paginate_queryset(self, queryset, page_size):
+        # Past the numbered pages, seek from the last post shown instead of using an ever larger OFFSET
+        self.next_cursor = None
+        after = self.request.GET.get('after')
+        if after is None or not self.is_seekable():
+            paginator, page, posts, is_paginated = super().paginate_queryset(queryset, page_size)
+            page.object_list = list(posts)
+            if paginator.truncated and not page.has_next() and self.is_seekable():
+                # The last numbered page links on to the older posts
+                self.next_cursor = encode_position(page.object_list[-1])
+            return paginator, page, page.object_list, is_paginated
+
+        try:
+            time, post_id, _ = decode_position(after)
+        except ValueError:
+            raise Http404('Invalid cursor')
+        posts = list(older_than(queryset, time, post_id)[:page_size + 1])
+        if len(posts) > page_size:
+            self.next_cursor = encode_position(posts[page_size - 1])
+        return None, None, posts[:page_size], False
+
     def get_context_data(self, **kwargs):
         # Retrieve the initial context data
         context = super().get_context_data(**kwargs)
 
         # Add filters to the context for displaying in the template
         context['filters'] = TYPES
+
+        # Keep the filters and search in the pagination links, and only link the pages around the current one
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params.pop('after', None)
+        context['query_prefix'] = f'{params.urlencode()}&' if params else ''
+        params.pop('sort', None)
+        context['sort_prefix'] = f'{params.urlencode()}&' if params else ''
+        context['sort'] = self.request.GET.get('sort', 'latest')
+        if context['is_paginated']:
+            page = context['page_obj']
+            context['page_links'] = list(page.paginator.get_elided_page_range(page.number, on_each_side=2, on_ends=1))
+        context['next_cursor'] = self.next_cursor
         return context
     
 
-class PostDetailView(DetailView):
+class PostDetailView(CachedPageMixin, DetailView):
+    cache_name = 'post_detail'
     model = HackerNewsPost
     template_name = 'webapp/post-detail.html'
     context_object_name = 'post'
@@ -46,20 +109,27 @@ class PostDetailView(DetailView):
         # Retrieve the initial context data
         context = super().get_context_data(**kwargs)
 
-        # Get the post object from the context
-        post = context['post']      
+        # Load the comment thread below the post, one query per level
+        context['comments'] = load_comment_tree(context['post'])
+        return context
+
+
+class AsyncPostDetailView(View):
+    '''PostDetailView on the async ORM, for the ASGI entry point, sharing its cached pages'''
+    template_name = PostDetailView.template_name
 
-        # Convert the 'kids' field from a string representation to a list
-        post.kids = literal_eval(post.kids)
+    async def get(self, request, pk):
+        # Keyed like CachedPageMixin, so both views serve the same cache entries
+        params = dict(request.GET.lists(), pk=[pk])
+        return HttpResponse(await aget_or_compute('post_detail', params, lambda: self.render(request, pk)))
 
-        # Retrieve and add the comments associated with the post to the context
-        comments = []
-        for kid in post.kids:
+    async def render(self, request, pk):
+        try:
+            post = await HackerNewsPost.objects.aget(pk=pk)
+        except HackerNewsPost.DoesNotExist:
+            raise Http404('No post found matching the query')
+        comments = await aload_comment_tree(post)
 
-            # Get the first comment with the given 'kid' post_id, ordered by 'time'
-            comment = HackerNewsPost.objects.filter(post_id=kid).order_by('time').first()
-            if comment:
-                comments.append(comment)
-        # Add the comments list to the context data
-        context['comments'] = comments
-        return context
\ No newline at end of file
+        # Every row the template shows is loaded; render it in a thread since the context processors may still query
+        context = {'post': post, 'object': post, 'comments': comments}
+        return await sync_to_async(render_to_string)(self.template_name, context, request)